@@ -3,12 +3,23 @@ from __future__ import annotations
 import sqlite3
 import os
 import sys
+import queue
+import functools
+import types
+import re
+import shutil
+import io
+import mmap
+import hashlib
+import unicodedata
+import mimetypes
 from datetime import datetime, date
-from flask import Flask, render_template, request, redirect, url_for, g, abort, make_response, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, g, abort, make_response, flash, jsonify, session
 from flask import send_from_directory
 import webbrowser
 import math
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 from fpdf import FPDF, HTMLMixin
 try:
     from PIL import Image
@@ -20,13 +31,23 @@ try:
 except Exception:
     webview = None
     WEBVIEW_AVAILABLE = False
+try:
+    # Moteur HTML -> PDF optionnel pour les très longues listes (voir generer_liste_editable_pdf)
+    from weasyprint import HTML as WeasyHTML
+    WEASYPRINT_AVAILABLE = True
+except Exception:
+    WeasyHTML = None
+    WEASYPRINT_AVAILABLE = False
 
 # Allow disabling embedded webview via environment variable
 USE_WEBVIEW = os.environ.get('USE_WEBVIEW', '1') not in ('0', 'false', 'False')
 WEBVIEW_ENABLED = WEBVIEW_AVAILABLE and USE_WEBVIEW
-from threading import Timer, Thread
+from threading import Thread, Event, Lock
+from concurrent.futures import ThreadPoolExecutor
 import random
 import logging
+from collections import Counter
+from itertools import zip_longest
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('FLASK_SECRET', 'dev-secret-please-change')
@@ -35,38 +56,159 @@ app.secret_key = os.environ.get('FLASK_SECRET', 'dev-secret-please-change')
 logger = logging.getLogger(__name__)
 
 # --- Fonctions et classes utilitaires pour la génération de PDF ---
+# Table de remplacement des accents français problématiques, construite une seule fois
+_ACCENT_TABLE = str.maketrans({
+    'é': 'e', 'è': 'e', 'ê': 'e', 'ë': 'e',
+    'à': 'a', 'â': 'a', 'ä': 'a',
+    'ù': 'u', 'û': 'u', 'ü': 'u',
+    'ô': 'o', 'ö': 'o',
+    'î': 'i', 'ï': 'i',
+    'ç': 'c',
+    'É': 'E', 'È': 'E', 'Ê': 'E', 'Ë': 'E',
+    'À': 'A', 'Â': 'A', 'Ä': 'A',
+    'Ù': 'U', 'Û': 'U', 'Ü': 'U',
+    'Ô': 'O', 'Ö': 'O',
+    'Î': 'I', 'Ï': 'I',
+    'Ç': 'C',
+})
+
+@functools.lru_cache(maxsize=4096)
 def encode_str(s):
     """Encode les chaînes pour fpdf avec les polices standard (latin-1).
-    Remplace les accents français problématiques par des variantes."""
-    s = str(s)
-    # Remplacer les accents problématiques
-    replacements = {
-        'é': 'e', 'è': 'e', 'ê': 'e', 'ë': 'e',
-        'à': 'a', 'â': 'a', 'ä': 'a',
-        'ù': 'u', 'û': 'u', 'ü': 'u',
-        'ô': 'o', 'ö': 'o',
-        'î': 'i', 'ï': 'i',
-        'ç': 'c',
-        'É': 'E', 'È': 'E', 'Ê': 'E', 'Ë': 'E',
-        'À': 'A', 'Â': 'A', 'Ä': 'A',
-        'Ù': 'U', 'Û': 'U', 'Ü': 'U',
-        'Ô': 'O', 'Ö': 'O',
-        'Î': 'I', 'Ï': 'I',
-        'Ç': 'C',
-    }
-    for old, new in replacements.items():
-        s = s.replace(old, new)
-    return s.encode('latin-1', 'replace').decode('latin-1')
+    Remplace les accents français problématiques par des variantes (en une seule passe).
+    Mis en cache : noms, classes et libellés reviennent d'un document à l'autre."""
+    return str(s).translate(_ACCENT_TABLE).encode('latin-1', 'replace').decode('latin-1')
+
+# Un signe facultatif, des chiffres, puis éventuellement un séparateur décimal et des chiffres
+_MONTANT_RE = re.compile(r'([+-]?)([0-9]*)(?:[.,]([0-9]*))?')
+
+def euros_str_to_cents(s):
+    """Convertit un montant saisi en euros ("19.99", "19,99", "20") en centimes entiers.
+    Calcul exact sur la chaîne (pas de float) ; lève ValueError si la saisie est invalide."""
+    m = _MONTANT_RE.fullmatch(str(s).strip())
+    if not m or not (m.group(2) or m.group(3)):
+        raise ValueError(f"Montant invalide : {s!r}")
+    signe, whole, frac = m.groups()
+    frac = ((frac or '') + '00')[:2]
+    cents = int(whole or 0) * 100 + int(frac)
+    return -cents if signe == '-' else cents
 
 def sanitize_filename(s):
     """Enlève les accents et caractères spéciaux du nom de fichier."""
-    import unicodedata
     s = str(s)
     # Normaliser et enlever les accents
     nfkd_form = unicodedata.normalize('NFKD', s)
     return ''.join([c for c in nfkd_form if not unicodedata.combining(c)])
 
 
+@functools.lru_cache(maxsize=64)
+def _file_sha1_cached(path, mtime_ns, size):
+    """SHA-1 of a file; mtime/size are part of the cache key so a rewritten file is re-hashed."""
+    with open(path, 'rb') as fh:
+        if hasattr(hashlib, 'file_digest'):
+            # Python 3.11+: the whole read/hash loop runs in C
+            return hashlib.file_digest(fh, lambda: hashlib.sha1(usedforsecurity=False)).hexdigest()
+        if size == 0:
+            return hashlib.sha1(b'', usedforsecurity=False).hexdigest()
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            return hashlib.sha1(memoryview(m), usedforsecurity=False).hexdigest()
+
+
+def file_sha1(path):
+    """Return the (cached) SHA-1 hex digest of a file, or None if it cannot be read."""
+    try:
+        st = os.stat(path)
+        return _file_sha1_cached(os.path.realpath(path), st.st_mtime_ns, st.st_size)
+    except Exception:
+        return None
+
+
+# Petit pool de threads pour les E/S fichiers indépendantes lors de la génération des PDF
+IO_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix='pdf-io')
+
+
+def prefetch_files(*paths):
+    """Hint the kernel (posix_fadvise WILLNEED) to start reading these files; no-op where unsupported."""
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    for path in paths:
+        if not path:
+            continue
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+
+def statinfo(path):
+    """os.stat(path), or None if the path is empty or missing — one syscall for exists/size/identity."""
+    if not path:
+        return None
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+def same_file_content(path_a, path_b, st_a=None, st_b=None):
+    """Return True if both paths are the same file or hold identical bytes.
+    Cheap checks come first (inode, size, first 4 KiB); the full hash is only computed as a last resort.
+    st_a / st_b may be passed when the caller already has the stat results.
+    """
+    try:
+        st_a = st_a or os.stat(path_a)
+        st_b = st_b or os.stat(path_b)
+        if (st_a.st_dev, st_a.st_ino) == (st_b.st_dev, st_b.st_ino):
+            return True
+        if st_a.st_size != st_b.st_size:
+            return False
+        with open(path_a, 'rb') as fa, open(path_b, 'rb') as fb:
+            if fa.read(4096) != fb.read(4096):
+                return False
+        if st_a.st_size <= 4096:
+            return True
+        return file_sha1(path_a) == file_sha1(path_b)
+    except Exception:
+        return False
+
+
+# Taille des blocs pour la copie des fichiers envoyés vers le disque
+UPLOAD_COPY_BUFFER = 1 << 20
+
+
+def stream_upload_to_disk(uploaded_file, dest_path):
+    """Write an uploaded file to dest_path using large blocks.
+    On Linux, when Werkzeug spooled the upload to a real temporary file, the copy stays in-kernel
+    (os.copy_file_range); otherwise, or if that fails, fall back to shutil.copyfileobj.
+    A SpooledTemporaryFile still held in memory (_rolled False) is copied directly: calling
+    fileno() on it would first write it to disk, so a small upload would be written twice.
+    """
+    stream = uploaded_file.stream
+    start = stream.tell()
+    with open(dest_path, 'wb', buffering=0) as out:
+        if sys.platform == 'linux' and hasattr(os, 'copy_file_range') and getattr(stream, '_rolled', True):
+            try:
+                src_fd = stream.fileno()
+                offset = start
+                while True:
+                    copied = os.copy_file_range(src_fd, out.fileno(), 1 << 30, offset_src=offset)
+                    if copied == 0:
+                        return
+                    offset += copied
+            except (OSError, ValueError, AttributeError):
+                # BytesIO uploads have no fileno; some filesystems refuse copy_file_range
+                out.seek(0)
+                out.truncate()
+                stream.seek(start)
+        shutil.copyfileobj(stream, out, UPLOAD_COPY_BUFFER)
+
+
 def save_uploaded_file(uploaded_file, subfolder='config', prefix=None):
     """Save uploaded file into uploads/<subfolder>/ and return relative path (subfolder/filename).
     Returns None if file not provided or invalid extension.
@@ -82,7 +224,7 @@ def save_uploaded_file(uploaded_file, subfolder='config', prefix=None):
     dest_dir = os.path.join(app.config['UPLOAD_FOLDER'], subfolder)
     os.makedirs(dest_dir, exist_ok=True)
     dest_path = os.path.join(dest_dir, filename)
-    uploaded_file.save(dest_path)
+    stream_upload_to_disk(uploaded_file, dest_path)
     # If PIL is available, normalize images:
     # - signatures (ordonnateur/secretaire) should be resized to 64x64px
     # - logos should be constrained to a reasonable max width to avoid huge files
@@ -93,17 +235,17 @@ def save_uploaded_file(uploaded_file, subfolder='config', prefix=None):
                 lower_prefix = (prefix or '').lower()
                 lower_fname = filename.lower()
                 if 'ordonnateur' in lower_prefix or 'secretaire' in lower_prefix or 'ordonnateur' in lower_fname or 'secretaire' in lower_fname:
-                    # Force exact 64x64 pixels for signatures
-                    img = img.convert('RGBA') if img.mode in ('RGBA', 'LA') else img.convert('RGB')
-                    img = img.resize((64, 64), Image.LANCZOS)
-                    img.save(dest_path)
+                    # Force exact 64x64 pixels for signatures (already-normalized files are left untouched)
+                    if img.size != (64, 64):
+                        img = img.convert('RGBA') if img.mode in ('RGBA', 'LA') else img.convert('RGB')
+                        img = img.resize((64, 64), Image.LANCZOS)
+                        img.save(dest_path)
                 else:
-                    # For logos, limit max width to avoid huge images (keep aspect ratio)
+                    # For logos, limit max width to avoid huge images (keep aspect ratio).
+                    # thumbnail() resizes in place and only ever shrinks; no re-encode if already small enough.
                     max_w = 512
                     if img.width > max_w:
-                        ratio = max_w / float(img.width)
-                        new_size = (max_w, int(img.height * ratio))
-                        img = img.resize(new_size, Image.LANCZOS)
+                        img.thumbnail((max_w, 10_000_000), Image.LANCZOS)
                         img.save(dest_path)
         except Exception:
             # best-effort: if resizing fails, keep original file
@@ -112,41 +254,152 @@ def save_uploaded_file(uploaded_file, subfolder='config', prefix=None):
     return os.path.join(subfolder, filename)
 
 
+# Index des clés de jointure / filtres des requêtes fréquentes (identiques à schema.sql)
+SCHEMA_INDEXES = (
+    # (creance_id, montant) couvre les SUM(montant) par créance sans lire la table ;
+    # il remplace l'ancien index sur creance_id seul
+    'CREATE INDEX IF NOT EXISTS idx_paiements_creance_montant ON paiements (creance_id, montant)',
+    'DROP INDEX IF EXISTS idx_paiements_creance',
+    'CREATE INDEX IF NOT EXISTS idx_participants_voyage_statut ON participants (voyage_id, statut)',
+    'CREATE INDEX IF NOT EXISTS idx_creances_participant ON creances (participant_id)',
+    'CREATE INDEX IF NOT EXISTS idx_demandes_fs_participant ON demandes_fonds_sociaux (participant_id)',
+    'CREATE INDEX IF NOT EXISTS idx_documents_voyage ON documents (voyage_id)',
+    'CREATE INDEX IF NOT EXISTS idx_budget_items_voyage_type ON budget_items (voyage_id, type)',
+    # clés étrangères vers les listes de référence : avec foreign_keys=ON, supprimer un mode de paiement
+    # ou une catégorie vérifie l'absence de lignes enfants par une recherche d'index et non un parcours
+    'CREATE INDEX IF NOT EXISTS idx_paiements_mode ON paiements (mode_paiement_id)',
+    'CREATE INDEX IF NOT EXISTS idx_budget_items_categorie ON budget_items (categorie_id)',
+)
+
+# Version des migrations de ensure_config_columns, enregistrée dans PRAGMA user_version.
+# À incrémenter à chaque nouvelle migration pour qu'elle soit appliquée aux bases existantes.
+SCHEMA_VERSION = 3
+
 def ensure_config_columns():
     """Ensure config_etablissement has image columns; run at startup even outside Flask request context.
     Uses a direct sqlite connection so this function can run before the app context is created.
+    Skipped entirely once the database's user_version has reached SCHEMA_VERSION.
     """
     conn = sqlite3.connect(app.config['DATABASE'])
     conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    try:
+        if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+            # already migrated: system payment mode ids are looked up lazily (get_mode_paiement_id)
+            conn.close()
+            return
+    except sqlite3.Error:
+        pass
+    configure_connection(conn)
 
-    cols = [r['name'] for r in cursor.execute("PRAGMA table_info(config_etablissement)").fetchall()]
     needed = {
         'logo_path': 'ALTER TABLE config_etablissement ADD COLUMN logo_path TEXT',
         'ordonnateur_image': 'ALTER TABLE config_etablissement ADD COLUMN ordonnateur_image TEXT',
         'secretaire_image': 'ALTER TABLE config_etablissement ADD COLUMN secretaire_image TEXT'
     }
 
-    for col, alter in needed.items():
-        if col not in cols:
-            try:
-                cursor.execute(alter)
-                conn.commit()
-            except Exception:
-                # best-effort: ignore failures
-                pass
-
-    # Ensure default config row exists
     try:
-        cursor.execute("INSERT OR IGNORE INTO config_etablissement (id, nom_etablissement) VALUES (1, 'Nom du Collège')")
+        cols = {r['name'] for r in conn.execute("SELECT name FROM pragma_table_info('config_etablissement')")}
+        # All migrations + the default row in a single transaction (one commit instead of one per column).
+        # sqlite3 does not open a transaction implicitly before DDL, hence the explicit BEGIN.
+        conn.execute('BEGIN')
+        # best-effort : une étape en échec n'empêche pas les autres, mais la base n'est alors pas
+        # marquée comme migrée (user_version inchangé) et tout sera retenté au prochain démarrage
+        failed = False
+        for col, alter in needed.items():
+            if col not in cols:
+                try:
+                    conn.execute(alter)
+                except sqlite3.Error:
+                    failed = True
+        # Index ajoutés après coup au schéma (voir schema.sql)
+        for ddl in SCHEMA_INDEXES:
+            try:
+                conn.execute(ddl)
+            except sqlite3.Error:
+                failed = True
+        # statistiques pour le planificateur (une fois, avec les nouveaux index)
+        try:
+            conn.execute('ANALYZE')
+        except sqlite3.Error:
+            failed = True
+        # Ensure default config row exists
+        try:
+            conn.execute("INSERT OR IGNORE INTO config_etablissement (id, nom_etablissement) VALUES (1, 'Nom du Collège')")
+        except sqlite3.Error:
+            failed = True
+        # Modes de paiement système (remboursements, fonds sociaux) : créés une fois, ids mis en cache
+        mode_ids = {}
+        try:
+            conn.executemany(SQL_SEED_MODE_PAIEMENT, [(libelle,) for libelle in MODES_SYSTEME])
+            placeholders = ','.join('?' * len(MODES_SYSTEME))
+            mode_ids = {r['libelle']: r['id'] for r in conn.execute(
+                f'SELECT id, libelle FROM modes_paiement WHERE libelle IN ({placeholders})', MODES_SYSTEME)}
+        except sqlite3.Error:
+            failed = True
+        if not failed:
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
         conn.commit()
+        # mis en cache seulement une fois les lignes validées
+        db_path = app.config['DATABASE']
+        _mode_ids.update({(db_path, libelle): mode_id for libelle, mode_id in mode_ids.items()})
     except Exception:
         pass
     finally:
-        cursor.close()
         conn.close()
 
 
+def file_fingerprint(path, st):
+    """Hashable identity of a file version (path, device, inode, size, mtime), or None if missing."""
+    if st is None:
+        return None
+    return (path, st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=16)
+def _pdf_image_bytes(fingerprint):
+    """Contents of one image file version (see file_fingerprint), read once for all PDFs."""
+    with open(fingerprint[0], 'rb') as f:
+        return f.read()
+
+
+def warm_pdf_image(path):
+    """Read an uploaded image in the background, so the first PDF after an upload
+    finds it in _pdf_image_bytes's cache instead of reading it inline."""
+    fp = file_fingerprint(path, statinfo(path))
+    if fp is not None:
+        IO_POOL.submit(_pdf_image_bytes, fp)
+
+
+def pdf_image_source(path, st):
+    """What to pass to pdf.image(): the cached file contents as a BytesIO (public fpdf2 input,
+    JPEG data still embedded as-is), or the path itself if the file cannot be read."""
+    fp = file_fingerprint(path, st)
+    if fp is None:
+        return path
+    try:
+        return io.BytesIO(_pdf_image_bytes(fp))
+    except OSError:
+        return path
+
+
+@functools.lru_cache(maxsize=32)
+def image_identity_flags(left_fp, right_fp, logo_fp):
+    """Return (same_sig, left_is_logo, right_is_logo) for three file fingerprints (see file_fingerprint).
+    Computed once per combination of file versions, then served from the cache for every later PDF.
+    """
+    # Ask the kernel to start reading the images now, then run the three independent
+    # comparisons concurrently so their I/O overlaps.
+    prefetch_files(*(fp[0] for fp in (left_fp, right_fp, logo_fp) if fp))
+
+    def compare(a, b):
+        if not (a and b):
+            return None
+        return IO_POOL.submit(same_file_content, a[0], b[0])
+
+    pending = (compare(left_fp, right_fp), compare(left_fp, logo_fp), compare(right_fp, logo_fp))
+    return tuple(bool(f and f.result()) for f in pending)
+
+
 def draw_signature_pair(pdf: PDF, config: dict, left_key: str, left_name: str, right_key: str, right_name: str, img_mm: float = 22):
     """Draw two signature blocks side by side: images (if present) and names below.
     img_mm is the size of the images in mm (width and height).
@@ -162,76 +415,35 @@ def draw_signature_pair(pdf: PDF, config: dict, left_key: str, left_name: str, r
     right_img = config.get(right_key)
     left_path = os.path.join(app.config['UPLOAD_FOLDER'], left_img) if left_img else None
     right_path = os.path.join(app.config['UPLOAD_FOLDER'], right_img) if right_img else None
-    # Determine actual file paths and check for duplicate files (same path or same content)
-
-    def file_sha1(path):
-        try:
-            import hashlib
-            h = hashlib.sha1()
-            with open(path, 'rb') as fh:
-                while True:
-                    chunk = fh.read(8192)
-                    if not chunk:
-                        break
-                    h.update(chunk)
-            return h.hexdigest()
-        except Exception:
-            return None
-
-    same_sig = False
-    if left_path and right_path and os.path.exists(left_path) and os.path.exists(right_path):
-        try:
-            if os.path.abspath(left_path) == os.path.abspath(right_path):
-                same_sig = True
-            else:
-                # if sizes differ, not identical; if same size, check sha1
-                if os.path.getsize(left_path) == os.path.getsize(right_path):
-                    same_sig = (file_sha1(left_path) == file_sha1(right_path))
-        except Exception:
-            same_sig = False
-    # DEBUG logging removed
-
     # Decide whether each signature is effectively a logo (same content) and whether left/right are duplicates
     logo_rel = config.get('logo_path')
     logo_path = os.path.join(app.config['UPLOAD_FOLDER'], logo_rel) if logo_rel else None
 
-    left_is_logo = False
-    if left_path and logo_path and os.path.exists(left_path) and os.path.exists(logo_path):
-        try:
-            left_is_logo = (os.path.abspath(left_path) == os.path.abspath(logo_path)) or (
-                os.path.getsize(left_path) == os.path.getsize(logo_path) and file_sha1(left_path) == file_sha1(logo_path)
-            )
-        except Exception:
-            left_is_logo = False
+    # One stat per file per PDF: existence checks and the fingerprints below reuse these results
+    left_st = statinfo(left_path)
+    right_st = statinfo(right_path)
+    logo_st = statinfo(logo_path)
 
-    right_is_logo = False
-    if right_path and logo_path and os.path.exists(right_path) and os.path.exists(logo_path):
-        try:
-            right_is_logo = (os.path.abspath(right_path) == os.path.abspath(logo_path)) or (
-                os.path.getsize(right_path) == os.path.getsize(logo_path) and file_sha1(right_path) == file_sha1(logo_path)
-            )
-        except Exception:
-            right_is_logo = False
+    # Dedupe decisions are memoized per file fingerprint: only the first PDF after an upload compares files
+    same_sig, left_is_logo, right_is_logo = image_identity_flags(
+        file_fingerprint(left_path, left_st), file_fingerprint(right_path, right_st), file_fingerprint(logo_path, logo_st))
 
     # Draw images at the same vertical position if applicable
     y0 = pdf.get_y()
-    if left_img and not left_is_logo:
-        left_img_path = os.path.join(app.config['UPLOAD_FOLDER'], left_img)
-        if os.path.exists(left_img_path):
-            try:
-                left_center = x_left + (col_w - img_mm) / 2
-                pdf.image(left_img_path, x=left_center, y=y0, w=img_mm, h=img_mm)
-            except Exception:
-                pass
+    if left_st and not left_is_logo:
+        try:
+            left_center = x_left + (col_w - img_mm) / 2
+            pdf.image(pdf_image_source(left_path, left_st), x=left_center, y=y0, w=img_mm, h=img_mm)
+        except Exception:
+            pass
 
-    if right_img and not same_sig and not right_is_logo:
-        right_img_path = os.path.join(app.config['UPLOAD_FOLDER'], right_img)
-        if os.path.exists(right_img_path):
-            try:
-                right_center = x_right + (col_w - img_mm) / 2
-                pdf.image(right_img_path, x=right_center, y=y0, w=img_mm, h=img_mm)
-            except Exception:
-                pass
+    # Only draw right image if it's present, not the same file as left (avoid duplicate), and not the logo
+    if right_st and not same_sig and not right_is_logo:
+        try:
+            right_center = x_right + (col_w - img_mm) / 2
+            pdf.image(pdf_image_source(right_path, right_st), x=right_center, y=y0, w=img_mm, h=img_mm)
+        except Exception:
+            pass
 
     # move Y below images to print names
     pdf.set_y(y0 + img_mm + 4)
@@ -241,19 +453,6 @@ def draw_signature_pair(pdf: PDF, config: dict, left_key: str, left_name: str, r
 
     # move to right column
     pdf.set_x(x_right)
-    # Only draw right image if it's present, not the same file as left (avoid duplicate), and not the logo
-    if right_img and not same_sig and not right_is_logo:
-        img_path = os.path.join(app.config['UPLOAD_FOLDER'], right_img)
-        if os.path.exists(img_path):
-            try:
-                x_center = x_right + (col_w - img_mm) / 2
-                y = pdf.get_y() - (img_mm + 4)  # previous Y used for left column
-                pdf.image(img_path, x=x_center, y=y, w=img_mm, h=img_mm)
-            except Exception:
-                pass
-    # ensure Y is properly placed to draw right name
-    pdf.set_y(pdf.get_y())
-    pdf.set_x(x_right)
     pdf.cell(col_w, 6, encode_str(right_name), 0, 1, 'C')
 
 
@@ -263,7 +462,8 @@ def draw_logo_if_present(pdf: PDF, config: dict, max_width_mm: float = 60):
     if not logo:
         return False
     img_path = os.path.join(app.config['UPLOAD_FOLDER'], logo)
-    if not os.path.exists(img_path):
+    st = statinfo(img_path)
+    if st is None:
         return False
     try:
         cw = content_width(pdf)
@@ -272,77 +472,119 @@ def draw_logo_if_present(pdf: PDF, config: dict, max_width_mm: float = 60):
         # compute x to center
         x = pdf.l_margin + (cw - w) / 2
         y = pdf.get_y()
-        pdf.image(img_path, x=x, y=y, w=w)
+        pdf.image(pdf_image_source(img_path, st), x=x, y=y, w=w)
         pdf.ln((w * 0.5) / 1 + 4)  # add some vertical space (approx image height)
         return True
     except Exception:
         return False
 
 
+def draw_letterhead(pdf: PDF, config, align: str = 'L', name_size: int = 14, service_h: float = 10, space_after: float = 15):
+    """En-tête commun des courriers : logo (si présent), nom de l'établissement et « Service de Gestion »."""
+    try:
+        draw_logo_if_present(pdf, config)
+    except Exception:
+        pass
+    pdf.set_font('Helvetica', 'B', name_size)
+    pdf.cell(0, 10, encode_str(config.get('nom_etablissement', 'Nom du Collège')), 0, 1, align)
+    pdf.set_font('Helvetica', '', 12)
+    pdf.cell(0, service_h, 'Service de Gestion', 0, 1, align)
+    pdf.ln(space_after)
+
+
+def draw_signoff(pdf: PDF, config, font_size: int = 11, space_after: float = 15):
+    """Pied commun : « Fait à <ville>, le <date> » puis les signatures ordonnateur / secrétaire général.
+    fpdf2 ignore déjà un set_font identique à la police courante : pas de suivi d'état supplémentaire ici."""
+    pdf.set_font('Helvetica', '', font_size)
+    pdf.cell(0, 7, encode_str(f"Fait à {config.get('ville_signature', 'Ville')}, le {date.today().strftime('%d/%m/%Y')}"), 0, 1, 'R')
+    pdf.ln(space_after)
+    draw_signature_pair(pdf, config, 'ordonnateur_image', config.get('ordonnateur_nom', 'Le Principal,'),
+                        'secretaire_image', config.get('secretaire_general_nom', 'Le Secrétaire Général,'), img_mm=22.6)
+
+
+# Map of on-disk filenames -> PDF family name to register (checked in this order)
+UNICODE_FONT_CANDIDATES = {
+    'DejaVuSans.ttf': 'DejaVuSans',
+    'DejaVuSans-Bold.ttf': 'DejaVuSans',
+    'NotoSans-Regular.ttf': 'NotoSans',
+    'NotoSans-Bold.ttf': 'NotoSans',
+}
+# family -> (regular filename, bold filename)
+UNICODE_FONT_FILES = {
+    'DejaVuSans': ('DejaVuSans.ttf', 'DejaVuSans-Bold.ttf'),
+    'NotoSans': ('NotoSans-Regular.ttf', 'NotoSans-Bold.ttf'),
+}
+
+
+@functools.lru_cache(maxsize=8)
+def find_unicode_font(search_paths: tuple):
+    """Locate the first usable unicode TTF family in search_paths.
+    Returns (family, regular_path, bold_path) — paths are None when missing/empty — or None.
+    Cached: each directory is scanned once per process instead of stat-ing every candidate per PDF.
+    """
+    for dirpath in search_paths:
+        try:
+            with os.scandir(dirpath) as it:
+                sizes = {e.name: e.stat().st_size for e in it if e.name in UNICODE_FONT_CANDIDATES}
+        except OSError:
+            continue
+        for filename, family in UNICODE_FONT_CANDIDATES.items():
+            if sizes.get(filename, 0) > 0:
+                regular_name, bold_name = UNICODE_FONT_FILES[family]
+                regular = os.path.join(dirpath, regular_name) if sizes.get(regular_name, 0) > 0 else None
+                bold = os.path.join(dirpath, bold_name) if sizes.get(bold_name, 0) > 0 else None
+                return family, regular, bold
+    return None
+
+
 def ensure_unicode_font(pdf: PDF, prefer='DejaVuSans'):
     """Try to add a unicode TTF font to the PDF instance if present on disk.
     Returns the font name to use or None.
     Checks a few common locations (project root, fonts/, uploads/config/).
     """
-    # Map of on-disk filenames -> PDF family name to register
-    candidate_map = {
-        'DejaVuSans.ttf': 'DejaVuSans',
-        'DejaVuSans-Bold.ttf': 'DejaVuSans',
-        'NotoSans-Regular.ttf': 'NotoSans',
-        'NotoSans-Bold.ttf': 'NotoSans',
-    }
-
-    search_paths = [
+    search_paths = (
         basedir,
         os.path.join(basedir, 'fonts'),
         os.path.join(app.config.get('UPLOAD_FOLDER', ''), 'config')
-    ]
+    )
+    found = find_unicode_font(search_paths)
+    if not found:
+        return None
+    family, regular, bold = found
 
-    found_base = None
-    for dirpath in search_paths:
-        for filename, family in candidate_map.items():
-            p = os.path.join(dirpath, filename)
-            if os.path.exists(p) and os.path.getsize(p) > 0:
-                # register both regular and bold variants if available
-                try:
-                    # determine regular and bold filenames for this family
-                    if family == 'DejaVuSans':
-                        regular = os.path.join(dirpath, 'DejaVuSans.ttf')
-                        bold = os.path.join(dirpath, 'DejaVuSans-Bold.ttf')
-                    else:
-                        regular = os.path.join(dirpath, 'NotoSans-Regular.ttf')
-                        bold = os.path.join(dirpath, 'NotoSans-Bold.ttf')
-
-                    # register regular
-                    if os.path.exists(regular) and os.path.getsize(regular) > 0:
-                        try:
-                            pdf.add_font(family, '', regular, uni=True)
-                        except Exception:
-                            pass
-
-                    # register bold if present
-                    if os.path.exists(bold) and os.path.getsize(bold) > 0:
-                        try:
-                            pdf.add_font(family, 'B', bold, uni=True)
-                        except Exception:
-                            pass
-
-                    found_base = family
-                    return found_base
-                except Exception:
-                    # try next one
-                    continue
+    # register regular
+    if regular:
+        try:
+            pdf.add_font(family, '', regular, uni=True)
+        except Exception:
+            pass
 
-    return None
+    # register bold if present
+    if bold:
+        try:
+            pdf.add_font(family, 'B', bold, uni=True)
+        except Exception:
+            pass
+
+    return family
 
 # Largeur utilisable pour multi_cell sur une page A4 avec marges de 15mm
 # Remove fixed MULTI_CELL_WIDTH constant — compute content width dynamically
 def content_width(pdf: FPDF) -> float:
-    """Retourne la largeur utilisable pour le contenu selon les marges du PDF (en mm)."""
-    # w = total page width (mm), l_margin and r_margin are set on the PDF instance
-    return pdf.w - pdf.l_margin - pdf.r_margin
+    """Retourne la largeur utilisable pour le contenu selon les marges du PDF (en mm).
+    Mémorisée sur les instances PDF (invalidée par add_page et les changements de marges)."""
+    cw = getattr(pdf, '_cw', None)
+    if cw is None:
+        # w = total page width (mm), l_margin and r_margin are set on the PDF instance
+        cw = pdf.w - pdf.l_margin - pdf.r_margin
+        if isinstance(pdf, PDF):
+            pdf._cw = cw
+    return cw
 
 class PDF(FPDF, HTMLMixin):
+    # cached content width (see content_width); reset whenever page size or margins may change
+    _cw = None
+
     def __init__(self, orientation: str = 'P', unit: str = 'mm', format: str = 'A4', margin_mm: int = 15, *args, **kwargs):
         # Normalize the call to parent with explicit defaults (orientation, unit, format)
         super().__init__(orientation=orientation, unit=unit, format=format, *args, **kwargs)
@@ -357,6 +599,23 @@ class PDF(FPDF, HTMLMixin):
             # if Helvetica isn't available, fall back to core font
             self.set_font('Arial', '', 11)
     
+    def add_page(self, *args, **kwargs):
+        self._cw = None
+        super().add_page(*args, **kwargs)
+        self._cw = None
+
+    def set_margins(self, *args, **kwargs):
+        self._cw = None
+        super().set_margins(*args, **kwargs)
+
+    def set_left_margin(self, *args, **kwargs):
+        self._cw = None
+        super().set_left_margin(*args, **kwargs)
+
+    def set_right_margin(self, *args, **kwargs):
+        self._cw = None
+        super().set_right_margin(*args, **kwargs)
+
     def header(self):
         # Optionally customize a minimal header area with a small top margin spacing
         # Keep header blank by default; derived usage may override
@@ -366,6 +625,21 @@ class PDF(FPDF, HTMLMixin):
         # Minimal footer to keep consistent bottom spacing - currently empty
         pass
 
+def new_attestation_pdf():
+    """PDF A4 portrait pour une attestation (paiement, remboursement, fonds social).
+    Attestation d'une page : flux de page minuscule, la compression zlib ne fait rien gagner."""
+    pdf = PDF(orientation='P', unit='mm', format='A4')
+    pdf.set_compression(False)
+    return pdf
+
+def pdf_response(pdf: FPDF, filename: str):
+    """Construit la réponse HTTP (pièce jointe) contenant le PDF généré.
+    Le bytearray produit par fpdf2 est transmis tel quel, sans copie intermédiaire en bytes."""
+    response = make_response(pdf.output())
+    response.headers.set('Content-Type', 'application/pdf')
+    response.headers.set('Content-Disposition', 'attachment', filename=filename)
+    return response
+
 @app.template_filter('format_currency')
 def format_currency_filter(value):
     """Formats an integer in cents to a string in euros."""
@@ -383,6 +657,11 @@ else:
     basedir = os.path.dirname(os.path.abspath(__file__))
 app.config['DATABASE'] = os.path.join(basedir, 'voyages_scolaires.db')
 app.config['UPLOAD_FOLDER'] = os.path.join(basedir, 'uploads')
+# Téléchargements déchargés sur un reverse proxy (désactivés par défaut, l'appli de bureau sert elle-même les fichiers) :
+# - USE_X_SENDFILE=1 : Apache/lighttpd (en-tête X-Sendfile géré par Flask)
+# - X_ACCEL_REDIRECT_PREFIX=/protected/ : nginx (location interne pointant sur uploads/)
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', '0') in ('1', 'true', 'True')
+app.config['X_ACCEL_REDIRECT_PREFIX'] = os.environ.get('X_ACCEL_REDIRECT_PREFIX') or None
 
 # Setup logging now that basedir is available
 LOG_DIR = os.path.join(basedir, 'logs')
@@ -402,47 +681,275 @@ logger = logging.getLogger(__name__)
 #  Gestion de la base de données
 # -------------------------------------------
 
+# PRAGMAs appliqués à chaque connexion : journal WAL (lecteurs non bloqués par l'écrivain),
+# synchronisation allégée, cache de pages plus grand et lectures via mmap.
+# Colonnes DATE : conversion explicite en datetime.date dans les deux sens (les convertisseurs
+# par défaut du module sqlite3 sont dépréciés depuis Python 3.12) ; date.fromisoformat est en C.
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_converter('DATE', lambda value: date.fromisoformat(value.decode()))
+
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;"
+    "PRAGMA synchronous=NORMAL;"
+    "PRAGMA cache_size=-20000;"
+    "PRAGMA temp_store=MEMORY;"
+    "PRAGMA mmap_size=268435456;"
+    # le schéma repose sur ON DELETE CASCADE (voyage -> participants -> créances -> paiements)
+    "PRAGMA foreign_keys=ON;"
+)
+
+def configure_connection(conn):
+    """Applique les PRAGMAs de performance à une connexion SQLite."""
+    conn.executescript(SQLITE_PRAGMAS)
+    return conn
+
+# Pool de connexions réutilisées d'une requête à l'autre (évite de rouvrir le fichier
+# .db / -wal / -shm à chaque requête). Chaque entrée est un tuple (chemin, connexion).
+DB_POOL_SIZE = 4
+_db_pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+
+def _open_connection(path):
+    """Ouvre une connexion SQLite configurée, utilisable depuis n'importe quel thread du serveur."""
+    conn = sqlite3.connect(
+        path,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        check_same_thread=False,
+        cached_statements=256
+    )
+    conn.row_factory = sqlite3.Row
+    return configure_connection(conn)
+
+def _acquire_connection():
+    """Récupère une connexion du pool (ou en ouvre une nouvelle) pour la base courante."""
+    path = app.config['DATABASE']
+    while True:
+        try:
+            pooled_path, conn = _db_pool.get_nowait()
+        except queue.Empty:
+            return _open_connection(path)
+        if pooled_path == path:
+            return conn
+        # la base a changé (chemin différent) : connexion obsolète
+        conn.close()
+
+def _release_connection(conn):
+    """Remet une connexion dans le pool, ou la ferme si le pool est plein."""
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+        _db_pool.put_nowait((app.config['DATABASE'], conn))
+    except (queue.Full, sqlite3.Error):
+        conn.close()
+
 def get_db():
-    """Ouvre une nouvelle connexion à la base de données si aucune n'existe pour le contexte actuel."""
+    """Récupère une connexion du pool si aucune n'est associée au contexte actuel."""
     if 'db' not in g:
-        g.db = sqlite3.connect(
-            app.config['DATABASE'],
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        g.db.row_factory = sqlite3.Row
+        g.db = _acquire_connection()
+        # point de départ pour savoir, en fin de requête, si celle-ci a écrit (invalidate_page_cache)
+        g.db_total_changes = g.db.total_changes
     return g.db
 
 @app.teardown_appcontext
 def close_db(exception):
-    """Ferme la connexion à la base de données à la fin de la requête."""
+    """Rend la connexion au pool à la fin de la requête."""
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        _release_connection(db)
+
+def write_ok(response):
+    """Marque la requête comme une écriture réussie et renvoie la réponse telle quelle.
+    Seules ces requêtes reçoivent 204 de no_content_for_ajax ; les autres redirections sont des refus."""
+    g.write_ok = True
+    return response
+
+@app.after_request
+def no_content_for_ajax(response):
+    """Client JS (fetch avec Accept: application/json, ou HTMX) : une écriture réussie (write_ok)
+    répond 204 au lieu de rediriger, ce qui évite au navigateur de recharger toute la page.
+    Toute autre redirection est un refus : 409 si un message flash 'warning' ou 'danger' l'explique
+    (message renvoyé en JSON), 400 sinon (saisie invalide) ; les messages sont alors retirés de la
+    session plutôt qu'affichés par une page ultérieure.
+    Les formulaires HTML classiques gardent la redirection."""
+    if request.method == 'POST' and response.status_code == 302 and (
+            request.headers.get('HX-Request') == 'true'
+            or request.accept_mimetypes.best == 'application/json'):
+        if g.get('write_ok'):
+            return app.response_class(status=204)
+        refus = [message for categorie, message in session.pop('_flashes', ())
+                 if categorie in ('warning', 'danger')]
+        if refus:
+            return make_response(jsonify({"status": "error", "message": ' '.join(refus)}), 409)
+        return make_response(jsonify({"status": "error", "message": "Requête invalide"}), 400)
+    return response
+
+def load_schema_sql():
+    """Retourne le script schema.sql."""
+    # prefer Flask's open_resource (searches in app.root_path), but fall back to basedir
+    try:
+        with app.open_resource('schema.sql', mode='r') as f:
+            return f.read()
+    except FileNotFoundError:
+        # Try to open schema.sql from the basedir (useful for frozen PyInstaller builds)
+        alt_path = os.path.join(basedir, 'schema.sql')
+        try:
+            with open(alt_path, 'r', encoding='utf8') as f:
+                return f.read()
+        except FileNotFoundError:
+            raise FileNotFoundError(f"schema.sql not found in app.open_resource or at {alt_path}")
 
 def init_db():
     """Initialise la base de données avec le schéma."""
+    schema = load_schema_sql()
     with app.app_context():
         db = get_db()
-        # prefer Flask's open_resource (searches in app.root_path), but fall back to basedir
-        schema_read = False
-        try:
-            with app.open_resource('schema.sql', mode='r') as f:
-                db.cursor().executescript(f.read())
-            schema_read = True
-        except FileNotFoundError:
-            # Try to open schema.sql from the basedir (useful for frozen PyInstaller builds)
-            alt_path = os.path.join(basedir, 'schema.sql')
-            try:
-                with open(alt_path, 'r', encoding='utf8') as f:
-                    db.cursor().executescript(f.read())
-                schema_read = True
-            except FileNotFoundError:
-                schema_read = False
-
-        if not schema_read:
-            raise FileNotFoundError(f"schema.sql not found in app.open_resource or at {alt_path}")
+        db.cursor().executescript(schema)
         db.commit()
 
+@functools.lru_cache(maxsize=1)
+def pristine_db():
+    """Base vierge en mémoire (schema.sql appliqué une seule fois), recopiée page à page
+    par reset_db_route via Connection.backup()."""
+    conn = sqlite3.connect(':memory:', check_same_thread=False)
+    conn.executescript(load_schema_sql())
+    # déjà au niveau des migrations de ensure_config_columns
+    conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    conn.commit()
+    return conn
+
+# -------------------------------------------
+#  Requêtes SQL réutilisées
+# -------------------------------------------
+# Définies une seule fois au niveau du module : le cache d'instructions préparées de sqlite3
+# (cached_statements) les retrouve à chaque requête sans les ré-analyser.
+
+SQL_VOYAGES_RESUME = """
+    SELECT v.*,
+           COALESCE(SUM(CASE WHEN p.statut = 'INSCRIT' THEN 1 ELSE 0 END), 0) as nb_inscrits,
+           COALESCE(SUM(CASE WHEN p.statut = 'A_REMBOURSER' AND COALESCE(p.remboursement_validé, 0) = 0 THEN 1 ELSE 0 END), 0) as nb_remboursables
+    FROM voyages v
+    LEFT JOIN participants p ON v.id = p.voyage_id
+    GROUP BY v.id
+    ORDER BY v.date_depart DESC
+"""
+
+# Participants d'un voyage avec leur créance, le total déjà payé et les montants qui en découlent
+# (reste à payer ; à rembourser : ce qui a été versé, tant que le remboursement n'est pas validé)
+SQL_PARTICIPANTS_FINANCES = """
+    SELECT p.*, c.montant_initial, c.montant_remise, c.id as creance_id,
+           COALESCE(SUM(pm.montant), 0) as total_paye,
+           MAX(0, c.montant_initial - c.montant_remise - COALESCE(SUM(pm.montant), 0)) as reste_a_payer,
+           CASE WHEN p.statut = 'A_REMBOURSER' AND p.remboursement_validé = 0
+                THEN MAX(0, COALESCE(SUM(pm.montant), 0)) ELSE 0 END as a_rembourser
+    FROM participants p
+    JOIN creances c ON p.id = c.participant_id
+    LEFT JOIN paiements pm ON pm.creance_id = c.id
+    WHERE p.voyage_id = ?
+    GROUP BY p.id
+    ORDER BY p.nom, p.prenom
+"""
+
+# Idem, limité aux participants inscrits
+SQL_INSCRITS_FINANCES = """
+    SELECT p.*, c.montant_initial, c.montant_remise, c.id as creance_id,
+           COALESCE(SUM(pm.montant), 0) as total_paye,
+           MAX(0, c.montant_initial - c.montant_remise - COALESCE(SUM(pm.montant), 0)) as reste_a_payer
+    FROM participants p
+    JOIN creances c ON p.id = c.participant_id
+    LEFT JOIN paiements pm ON pm.creance_id = c.id
+    WHERE p.voyage_id = ? AND p.statut = 'INSCRIT'
+    GROUP BY p.id
+    ORDER BY p.nom, p.prenom
+"""
+
+# Nombre d'inscrits d'un voyage (ayant une créance) et total qu'ils ont versé
+SQL_RECAP_INSCRITS = """
+    SELECT COUNT(DISTINCT p.id) as nb_inscrits, COALESCE(SUM(pm.montant), 0) as total_percu
+    FROM participants p
+    JOIN creances c ON p.id = c.participant_id
+    LEFT JOIN paiements pm ON pm.creance_id = c.id
+    WHERE p.voyage_id = ? AND p.statut = 'INSCRIT'
+"""
+
+SQL_PARTICIPANT = 'SELECT * FROM participants WHERE id = ?'
+# Paiement avec le participant de sa créance (modification / suppression d'un paiement)
+SQL_PAIEMENT_PARTICIPANT = """
+    SELECT pm.*, c.participant_id, p.nom as participant_nom, p.prenom as participant_prenom
+    FROM paiements pm
+    JOIN creances c ON c.id = pm.creance_id
+    JOIN participants p ON p.id = c.participant_id
+    WHERE pm.id = ?
+"""
+SQL_CREANCE_PAR_PARTICIPANT = 'SELECT * FROM creances WHERE participant_id = ?'
+SQL_CREANCE_ID_PAR_PARTICIPANT = 'SELECT id FROM creances WHERE participant_id = ?'
+SQL_TOTAL_PAIEMENTS = 'SELECT SUM(montant) as total FROM paiements WHERE creance_id = ?'
+SQL_TOTAL_VERSEMENTS = 'SELECT SUM(montant) as total FROM paiements WHERE creance_id = ? AND montant > 0'
+SQL_TOTAL_REMBOURSEMENTS = "SELECT SUM(montant) as total FROM paiements WHERE creance_id = ? AND montant < 0 AND reference LIKE '%Remboursement%'"
+SQL_CONFIG_ETABLISSEMENT = 'SELECT * FROM config_etablissement WHERE id = 1'
+SQL_MODES_PAIEMENT = 'SELECT * FROM modes_paiement ORDER BY libelle'
+SQL_INSERT_PAIEMENT = 'INSERT INTO paiements (creance_id, mode_paiement_id, montant, date, reference) VALUES (?, ?, ?, ?, ?)'
+# Paiement rattaché à la créance d'un participant : (mode_paiement_id, montant, date, reference, participant_id)
+SQL_INSERT_PAIEMENT_PARTICIPANT = """
+    INSERT INTO paiements (creance_id, mode_paiement_id, montant, date, reference)
+    SELECT c.id, ?, ?, ?, ? FROM creances c WHERE c.participant_id = ?
+"""
+SQL_SEED_MODE_PAIEMENT = 'INSERT OR IGNORE INTO modes_paiement (libelle) VALUES (?)'
+# Lignes qui référencent un mode de paiement / une catégorie (recherche indexée, arrêtée à la première)
+SQL_MODE_PAIEMENT_UTILISE = 'SELECT 1 FROM paiements WHERE mode_paiement_id = ? LIMIT 1'
+SQL_CATEGORIE_UTILISEE = 'SELECT 1 FROM budget_items WHERE categorie_id = ? LIMIT 1'
+# Ajout d'un élève : le statut (INSCRIT, ou LISTE_ATTENTE si le nombre d'inscrits attendu est atteint)
+# est décidé par la même instruction que l'insertion ; aucune ligne insérée si le voyage n'existe pas
+SQL_INSERT_ELEVE = """
+    INSERT INTO participants (voyage_id, type, nom, prenom, classe, statut)
+    SELECT v.id, 'ELEVE', ?, ?, ?,
+           CASE WHEN (SELECT COUNT(*) FROM participants p WHERE p.voyage_id = v.id AND p.statut = 'INSCRIT')
+                     < v.nb_participants_attendu
+                THEN 'INSCRIT' ELSE 'LISTE_ATTENTE' END
+    FROM voyages v WHERE v.id = ?
+    RETURNING id
+"""
+SQL_INSERT_CREANCE_PRIX_VOYAGE = 'INSERT INTO creances (participant_id, montant_initial) SELECT ?, prix_eleve FROM voyages WHERE id = ?'
+SQL_INSERT_PARTICIPANT = 'INSERT INTO participants (voyage_id, type, nom, prenom, classe, statut) VALUES (?, ?, ?, ?, ?, ?)'
+SQL_INSERT_CREANCE = 'INSERT INTO creances (participant_id, montant_initial) VALUES (?, ?)'
+SQL_UPDATE_STATUT_PARTICIPANT = 'UPDATE participants SET statut = ? WHERE id = ?'
+# Cases à cocher modifiables via toggle_validation : une requête figée par colonne autorisée,
+# l'inversion et la lecture de la nouvelle valeur se font en une seule instruction
+SQL_TOGGLE_VALIDATION = {
+    field: f'UPDATE participants SET {field} = 1 - {field} WHERE id = ? RETURNING {field}'
+    for field in ('fiche_engagement', 'liste_definitive')
+}
+# Voyage minimal (données de démonstration / de test)
+SQL_INSERT_VOYAGE_SIMPLE = 'INSERT INTO voyages (destination, date_depart, prix_eleve, nb_participants_attendu) VALUES (?, ?, ?, ?)'
+
+# Une créance au prix du voyage pour chaque participant du voyage qui n'en a pas encore
+SQL_CREANCES_VOYAGE = """
+    INSERT INTO creances (participant_id, montant_initial)
+    SELECT p.id, ? FROM participants p
+    WHERE p.voyage_id = ?
+      AND NOT EXISTS (SELECT 1 FROM creances c WHERE c.participant_id = p.id)
+    ORDER BY p.id
+"""
+# (participant_id, creance_id) des participants d'un voyage, dans l'ordre d'insertion
+SQL_CREANCES_PAR_VOYAGE = """
+    SELECT p.id, c.id FROM participants p
+    JOIN creances c ON c.participant_id = p.id
+    WHERE p.voyage_id = ? ORDER BY p.id
+"""
+
+# Paiement négatif soldant tout ce qu'un participant a versé (aucune ligne si rien n'a été versé)
+SQL_INSERER_REMBOURSEMENT = """
+    WITH s AS (
+        SELECT c.id AS cid, COALESCE(SUM(pm.montant), 0) AS tot
+        FROM creances c
+        LEFT JOIN paiements pm ON pm.creance_id = c.id
+        WHERE c.participant_id = ?
+        GROUP BY c.id
+    )
+    INSERT INTO paiements (creance_id, mode_paiement_id, montant, date, reference)
+    SELECT cid, ?, -tot, ?, ?
+    FROM s WHERE tot > 0
+"""
+SQL_BUDGET_CATEGORIES = 'SELECT * FROM budget_categories ORDER BY nom'
+
 # -------------------------------------------
 #  Fonctions utilitaires pour la base de données
 # -------------------------------------------
@@ -461,52 +968,156 @@ def get_participant(participant_id):
     """Récupère un participant par son ID, lève une erreur 404 si non trouvé."""
     db = get_db()
     participant = db.execute(
-        'SELECT * FROM participants WHERE id = ?', (participant_id,)
+        SQL_PARTICIPANT, (participant_id,)
     ).fetchone()
     if participant is None:
         abort(404, f"Le participant avec l'ID {participant_id} n'existe pas.")
     return participant
 
 def get_paiement(paiement_id):
-    """Récupère un paiement par son ID, lève une erreur 404 si non trouvé."""
+    """Récupère un paiement par son ID, avec l'id, le nom et le prénom de son participant
+    (même requête), lève une erreur 404 si non trouvé."""
     db = get_db()
-    paiement = db.execute(
-        'SELECT * FROM paiements WHERE id = ?', (paiement_id,)
-    ).fetchone()
+    paiement = db.execute(SQL_PAIEMENT_PARTICIPANT, (paiement_id,)).fetchone()
     if paiement is None:
         abort(404, f"Le paiement avec l'ID {paiement_id} n'existe pas.")
     return paiement
 
+# Configuration de l'établissement mise en cache pour tout le processus, par fichier de base.
+# Elle ne change que via enregistrer_config (ou une réinitialisation), qui vident ce cache.
+_config_cache = {}
+
+def invalidate_config_cache():
+    """Oublie la configuration mise en cache (à appeler après toute modification de config_etablissement)."""
+    _config_cache.clear()
+    g.pop('config_etablissement', None)
+
+def get_config():
+    """Récupère la configuration de l'établissement (mapping en lecture seule, vide si absente).
+    Lue en base une seule fois puis servie depuis le cache du processus ; flask.g en garde une référence par requête.
+    """
+    if 'config_etablissement' not in g:
+        db_path = app.config['DATABASE']
+        config = _config_cache.get(db_path)
+        if config is None:
+            try:
+                row = get_db().execute(SQL_CONFIG_ETABLISSEMENT).fetchone()
+            except sqlite3.Error:
+                row = None
+            # lecture seule : le même objet est partagé entre requêtes et threads
+            config = types.MappingProxyType(dict(row) if row else {})
+            if row is not None:
+                _config_cache[db_path] = config
+        g.config_etablissement = config
+    return g.config_etablissement
+
+# Listes de référence (modes de paiement, catégories budgétaires) mises en cache de la même façon,
+# par fichier de base et par requête SQL ; vidées par les routes qui les modifient.
+_reference_cache = {}
+
+def get_reference_rows(sql):
+    """Lignes d'une liste de référence (SQL_MODES_PAIEMENT, SQL_BUDGET_CATEGORIES), lues une seule fois.
+    Tuple de sqlite3.Row (lecture seule), partageable entre requêtes."""
+    key = (app.config['DATABASE'], sql)
+    rows = _reference_cache.get(key)
+    if rows is None:
+        rows = tuple(get_db().execute(sql).fetchall())
+        _reference_cache[key] = rows
+    return rows
+
+def invalidate_reference_cache():
+    """Oublie les listes de référence (après ajout/suppression d'un mode de paiement ou d'une catégorie)."""
+    _reference_cache.clear()
+
+# Pages HTML en lecture seule (accueil, budget d'un voyage) gardées déjà rendues.
+# Une requête qui a modifié la base (total_changes de sa connexion) vide le cache à sa fin et
+# incrémente la génération : un rendu commencé avant l'écriture n'est alors pas conservé.
+# Lecture de la génération, contrôle + stockage et vidage se font sous le même verrou.
+_page_cache = {}
+_page_cache_generation = 0
+_page_cache_lock = Lock()
+
+def cached_page(view):
+    """Met en cache le HTML rendu par une vue GET, par base de données et paramètres d'URL."""
+    @functools.wraps(view)
+    def wrapper(**kwargs):
+        # des messages flash en attente doivent être affichés (et consommés) par un vrai rendu
+        if session.get('_flashes'):
+            return view(**kwargs)
+        key = (app.config['DATABASE'], view.__name__, tuple(sorted(kwargs.items())))
+        with _page_cache_lock:
+            html = _page_cache.get(key)
+            generation = _page_cache_generation
+        if html is None:
+            html = view(**kwargs)
+            with _page_cache_lock:
+                if generation == _page_cache_generation:
+                    _page_cache[key] = html
+        return html
+    return wrapper
+
+def invalidate_page_cache():
+    """Oublie toutes les pages mises en cache (après une écriture en base)."""
+    global _page_cache_generation
+    with _page_cache_lock:
+        _page_cache_generation += 1
+        _page_cache.clear()
+
+@app.teardown_request
+def invalidate_page_cache_after_write(exception):
+    """Vide le cache des pages si la requête a modifié la base, même en cas d'erreur ;
+    les requêtes en lecture seule (pages, PDF) le laissent intact."""
+    db = g.get('db')
+    if db is not None and db.total_changes != g.db_total_changes:
+        invalidate_page_cache()
+
+# Modes de paiement utilisés par l'application elle-même (remboursements, fonds sociaux).
+# Créés par schema.sql / ensure_config_columns ; leurs ids sont gardés au niveau du module,
+# par base de données (même clé que _config_cache).
+MODES_SYSTEME = ('Remboursement', 'Fonds Social')
+_mode_ids = {}
+
+def get_mode_paiement_id(libelle):
+    """Renvoie l'id d'un mode de paiement d'après son libellé, mis en cache pour le processus.
+    Sert aux modes système (recréés s'ils ont été supprimés depuis la configuration) et aux données de test.
+    Un mode recréé ici n'est pas mis en cache : tant que l'appelant n'a pas validé sa transaction,
+    un rollback peut encore faire disparaître la ligne."""
+    key = (app.config['DATABASE'], libelle)
+    mode_id = _mode_ids.get(key)
+    if mode_id is None:
+        db = get_db()
+        created = db.execute(SQL_SEED_MODE_PAIEMENT, (libelle,)).rowcount
+        if created:
+            invalidate_reference_cache()
+        mode_id = db.execute('SELECT id FROM modes_paiement WHERE libelle = ?', (libelle,)).fetchone()['id']
+        if not created:
+            _mode_ids[key] = mode_id
+    return mode_id
+
+def bulk_insert_paiements(db, rows):
+    """Insère plusieurs paiements en une seule instruction préparée (executemany).
+    rows : tuples (creance_id, mode_paiement_id, montant, date, reference).
+    Pas de commit ici : l'appelant regroupe tout dans une seule transaction."""
+    db.executemany(SQL_INSERT_PAIEMENT, rows)
+
+def insert_demo_participants(db, voyage_id, rows, prix):
+    """Insère les participants d'un voyage (executemany), puis toutes leurs créances
+    en une seule instruction INSERT ... SELECT. Pas de commit ici non plus."""
+    db.executemany(SQL_INSERT_PARTICIPANT, rows)
+    db.execute(SQL_CREANCES_VOYAGE, (prix, voyage_id))
+
 # -------------------------------------------
 #  Routes principales
 # -------------------------------------------
 
 @app.route('/')
+@cached_page
 def index():
     """Affiche la liste de tous les voyages avec le nombre d'inscrits."""
     db = get_db()
-    voyages_raw = db.execute(
-        """
-        SELECT v.*, COUNT(p.id) as nb_inscrits
-        FROM voyages v
-        LEFT JOIN participants p ON v.id = p.voyage_id AND p.statut = 'INSCRIT'
-        GROUP BY v.id
-        ORDER BY v.date_depart DESC
-        """
-    ).fetchall()
-
-    voyages = []
-    for v in voyages_raw:
-        voyage_dict = dict(v)
-        # Calculer le nombre d'élèves à rembourser pour chaque voyage
-        nb_remboursables = db.execute(
-            """
-            SELECT COUNT(*) FROM participants
-            WHERE voyage_id = ? AND statut = 'A_REMBOURSER' AND (remboursement_validé IS NULL OR remboursement_validé = 0)
-            """, (v['id'],)
-        ).fetchone()[0]
-        voyage_dict['nb_remboursables'] = nb_remboursables
-        voyages.append(voyage_dict)
+    # nb_inscrits et nb_remboursables sont calculés directement dans la requête :
+    # les sqlite3.Row sont passées telles quelles au template (accès par nom), sans copie en dict
+    voyages = db.execute(SQL_VOYAGES_RESUME).fetchall()
 
     return render_template('index.html', voyages=voyages)
 
@@ -532,18 +1143,35 @@ def ajouter_document(voyage_id):
         voyage_folder = os.path.join(app.config['UPLOAD_FOLDER'], str(voyage_id))
         os.makedirs(voyage_folder, exist_ok=True)
         
-        unique_filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{filename}"
+        # un seul instant pour le nom de fichier et la date d'upload
+        now = datetime.now()
+        unique_filename = f"{now.strftime('%Y%m%d%H%M%S')}_{filename}"
         file_path = os.path.join(voyage_folder, unique_filename)
-        file.save(file_path)
+        # Écriture sous un nom temporaire, renommée (os.replace, atomique) juste avant le COMMIT :
+        # la base ne référence jamais un fichier absent ou à moitié écrit
+        tmp_path = file_path + '.part'
+        stream_upload_to_disk(file, tmp_path)
 
         db = get_db()
-        db.execute(
-            "INSERT INTO documents (voyage_id, nom_fichier, chemin_stockage, date_upload) VALUES (?, ?, ?, ?)",
-            (voyage_id, filename, os.path.join(str(voyage_id), unique_filename), date.today())
-        )
-        db.commit()
+        # fichier à supprimer si la transaction échoue : le temporaire, puis le fichier renommé
+        # (le COMMIT peut encore échouer après os.replace)
+        on_disk = tmp_path
+        try:
+            with db:
+                db.execute(
+                    "INSERT INTO documents (voyage_id, nom_fichier, chemin_stockage, date_upload) VALUES (?, ?, ?, ?)",
+                    (voyage_id, filename, os.path.join(str(voyage_id), unique_filename), now.date())
+                )
+                os.replace(tmp_path, file_path)
+                on_disk = file_path
+        except Exception:
+            try:
+                os.remove(on_disk)
+            except FileNotFoundError:
+                pass
+            raise
 
-    return redirect(url_for('voyage_details', voyage_id=voyage_id, tab='documents'))
+    return write_ok(redirect(url_for('voyage_details', voyage_id=voyage_id, tab='documents')))
 
 @app.route('/documents/telecharger/<path:filename>')
 def telecharger_document(filename):
@@ -552,7 +1180,20 @@ def telecharger_document(filename):
     # If some callers require a forced download, they can call this route with ?download=1
     download = request.args.get('download')
     as_attachment = True if download and download in ('1', 'true', 'yes') else False
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename, as_attachment=as_attachment)
+    # Derrière nginx : laisser le proxy envoyer le fichier (sendfile) via X-Accel-Redirect
+    accel_prefix = app.config.get('X_ACCEL_REDIRECT_PREFIX')
+    if accel_prefix:
+        file_path = safe_join(app.config['UPLOAD_FOLDER'], filename)
+        if file_path is None or not os.path.isfile(file_path):
+            abort(404)
+        resp = make_response('')
+        resp.headers.set('X-Accel-Redirect', f"{accel_prefix.rstrip('/')}/{filename}")
+        resp.headers.set('Content-Type', mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        if as_attachment:
+            resp.headers.set('Content-Disposition', 'attachment', filename=os.path.basename(filename))
+        return resp
+    # conditional=True : réponses 304 / requêtes Range ; X-Sendfile si USE_X_SENDFILE est activé
+    return send_from_directory(app.config['UPLOAD_FOLDER'], filename, as_attachment=as_attachment, conditional=True)
 
 @app.route('/documents/supprimer/<int:doc_id>', methods=['POST'])
 def supprimer_document(doc_id):
@@ -564,18 +1205,18 @@ def supprimer_document(doc_id):
 
     if doc:
         voyage_id = doc['voyage_id']
-        # Supprimer le fichier physique
+        # Supprimer l'entrée dans la base de données
+        with db:
+            db.execute('DELETE FROM documents WHERE id = ?', (doc_id,))
+
+        # Supprimer le fichier physique, hors transaction
         try:
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], doc['chemin_stockage'])
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            os.remove(os.path.join(app.config['UPLOAD_FOLDER'], doc['chemin_stockage']))
+        except FileNotFoundError:
+            pass
         except OSError as e:
             print(f"Erreur lors de la suppression du fichier {doc['chemin_stockage']}: {e}")
-
-        # Supprimer l'entrée dans la base de données
-        db.execute('DELETE FROM documents WHERE id = ?', (doc_id,))
-        db.commit()
-        return redirect(url_for('voyage_details', voyage_id=voyage_id, tab='documents'))
+        return write_ok(redirect(url_for('voyage_details', voyage_id=voyage_id, tab='documents')))
 
     # Si le document n'existe pas, rediriger vers l'accueil
     return redirect(url_for('index'))
@@ -585,59 +1226,26 @@ def voyage_details(voyage_id):
     """Affiche les détails d'un voyage, y compris les participants et les paiements."""
     voyage = get_voyage(voyage_id)
     db = get_db()
-    # récupérer la config pour utiliser logo + signatures dans le PDF
-    config_row = db.execute("SELECT * FROM config_etablissement WHERE id = 1").fetchone()
-    config = dict(config_row) if config_row else {}
-    
-    # Jointure pour récupérer les participants et leurs créances
-    participants_raw = db.execute(
-        """
-        SELECT p.*, c.montant_initial, c.montant_remise, c.id as creance_id
-        FROM participants p
-        JOIN creances c ON p.id = c.participant_id
-        WHERE p.voyage_id = ?
-        ORDER BY p.nom, p.prenom
-        """, (voyage_id,)
-    ).fetchall()
-    nb_inscrits = len([p for p in participants_raw if p['statut'] == 'INSCRIT'])
-    nb_attente = len([p for p in participants_raw if p['statut'] == 'LISTE_ATTENTE'])
+    # Jointure pour récupérer les participants, leurs créances et le total payé (une seule requête)
+    # Montants dérivés (reste à payer, à rembourser) calculés par la requête : les sqlite3.Row
+    # sont passées telles quelles au template, sans copie en dict par ligne
+    participants = db.execute(SQL_PARTICIPANTS_FINANCES, (voyage_id,)).fetchall()
+    # Comptage des statuts en une seule passe sur les lignes déjà chargées
+    statuts = Counter(p['statut'] for p in participants)
+    nb_inscrits = statuts['INSCRIT']
+    nb_attente = statuts['LISTE_ATTENTE']
 
     documents = db.execute(
         'SELECT * FROM documents WHERE voyage_id = ? ORDER BY date_upload DESC', (voyage_id,)
     ).fetchall()
 
-    modes_paiement = db.execute('SELECT * FROM modes_paiement ORDER BY libelle').fetchall()
+    modes_paiement = get_reference_rows(SQL_MODES_PAIEMENT)
 
-    participants_details = []
-    total_percu_voyage_cents = 0
-
-    for participant in participants_raw:
-        participant_dict = dict(participant)
-        paiements = db.execute(
-            'SELECT SUM(montant) as total FROM paiements WHERE creance_id = ?', (participant['creance_id'],)
-        ).fetchone()
-        total_paye_cents = paiements['total'] or 0
-        solde_a_payer_cents = participant['montant_initial'] - participant['montant_remise']
-
-        participant_dict['total_paye'] = total_paye_cents
-        participant_dict['reste_a_payer'] = max(0, solde_a_payer_cents - total_paye_cents)
-        remboursement_valide = participant['remboursement_validé'] if 'remboursement_validé' in participant.keys() else 0
-        # Montant à rembourser pour un participant en A_REMBOURSER : rembourser ce qui a été payé
-        if participant['statut'] == 'A_REMBOURSER' and remboursement_valide == 0:
-            # Rembourser ce qui a été versé (total_paye_cents)
-            participant_dict['a_rembourser'] = max(0, total_paye_cents)
-        else:
-            participant_dict['a_rembourser'] = 0
-        participant_dict['remboursement_validé'] = remboursement_valide
-
-        if participant['statut'] == 'INSCRIT':
-            total_percu_voyage_cents += total_paye_cents
-
-        participants_details.append(participant_dict)
+    total_percu_voyage_cents = sum(p['total_paye'] for p in participants if p['statut'] == 'INSCRIT')
 
     montant_total_attendu_cents = voyage['nb_participants_attendu'] * voyage['prix_eleve']
 
-    return render_template('voyage_details.html', voyage=voyage, participants=participants_details, modes_paiement=modes_paiement,
+    return render_template('voyage_details.html', voyage=voyage, participants=participants, modes_paiement=modes_paiement,
                            documents=documents, nb_inscrits=nb_inscrits, total_percu_voyage=total_percu_voyage_cents,
                            montant_total_attendu=montant_total_attendu_cents, nb_attente=nb_attente)
 
@@ -648,27 +1256,11 @@ def liste_editable(voyage_id):
     voyage = get_voyage(voyage_id)
     db = get_db()
 
-    participants_raw = db.execute(
-        """
-        SELECT p.*, c.montant_initial, c.montant_remise, c.id as creance_id
-        FROM participants p
-        JOIN creances c ON p.id = c.participant_id
-        WHERE p.voyage_id = ? AND p.statut = 'INSCRIT'
-        ORDER BY p.nom, p.prenom
-        """, (voyage_id,)
-    ).fetchall()
+    # reste_a_payer est calculé par la requête : lignes passées telles quelles au template
+    participants = db.execute(SQL_INSCRITS_FINANCES, (voyage_id,)).fetchall()
 
-    participants_details = []
-    for participant in participants_raw:
-        participant_dict = dict(participant)
-        paiements = db.execute('SELECT SUM(montant) as total FROM paiements WHERE creance_id = ?', (participant['creance_id'],)).fetchone()
-        total_paye_cents = paiements['total'] or 0
-        solde_a_payer_cents = participant['montant_initial'] - participant['montant_remise']
-        participant_dict['total_paye'] = total_paye_cents
-        participant_dict['reste_a_payer'] = max(0, solde_a_payer_cents - total_paye_cents)
-        participants_details.append(participant_dict)
-
-    return render_template('liste_editable.html', voyage=voyage, participants=participants_details)
+    return render_template('liste_editable.html', voyage=voyage, participants=participants,
+                           html_engine=WEASYPRINT_AVAILABLE)
 
 
 @app.route('/voyage/<int:voyage_id>/export_liste_pdf', methods=['GET'])
@@ -679,40 +1271,16 @@ def export_liste_pdf(voyage_id):
     voyage = get_voyage(voyage_id)
     db = get_db()
 
-    participants_raw = db.execute(
-        """
-        SELECT p.id, p.nom, p.prenom, p.classe, c.montant_initial, c.montant_remise, c.id as creance_id
-        FROM participants p
-        JOIN creances c ON p.id = c.participant_id
-        WHERE p.voyage_id = ? AND p.statut = 'INSCRIT'
-        ORDER BY p.nom, p.prenom
-        """, (voyage_id,)
-    ).fetchall()
-
-    rows = []
-    for participant in participants_raw:
-        paiements = db.execute('SELECT SUM(montant) as total FROM paiements WHERE creance_id = ?', (participant['creance_id'],)).fetchone()
-        total_paye_cents = paiements['total'] or 0
-        solde_a_payer_cents = participant['montant_initial'] - participant['montant_remise']
-        reste_cents = max(0, solde_a_payer_cents - total_paye_cents)
-        rows.append({
-            'nom': participant['nom'],
-            'prenom': participant['prenom'],
-            'classe': participant['classe'],
-            'reste_a_payer': reste_cents
-        })
+    # nom, prénom, classe et reste à payer lus directement sur les sqlite3.Row
+    rows = db.execute(SQL_INSCRITS_FINANCES, (voyage_id,)).fetchall()
 
     # PDF generation: short, tidy table
     pdf = PDF()
     pdf.add_page()
 
     # draw logo if present
-    try:
-        config_row = db.execute("SELECT * FROM config_etablissement WHERE id = 1").fetchone()
-        config = dict(config_row) if config_row else {}
-    except Exception:
-        config = {}
-        draw_logo_if_present(pdf, config)
+    config = get_config()
+    draw_logo_if_present(pdf, config)
 
     # Try to enable a unicode TTF to render accents and € correctly
     font_used = ensure_unicode_font(pdf)
@@ -725,51 +1293,52 @@ def export_liste_pdf(voyage_id):
     pdf.ln(3)
 
     # header — use unicode font if available so accents and € render correctly
-    if font_used:
-        pdf.set_font(font_used, 'B', 11)
-    else:
-        pdf.set_font('Helvetica', 'B', 11)
+    font_family = font_used or 'Helvetica'
     cw = content_width(pdf)
     col_w = [cw * 0.35, cw * 0.30, cw * 0.15, cw * 0.20]
     pdf.set_fill_color(240, 240, 240)
     headers = ['Nom', 'Prénom', 'Classe', 'Reste à payer (EUR)']
-    for i, h in enumerate(headers):
-        text = h if font_used else encode_str(h)
-        pdf.cell(col_w[i], 8, text, border=1, align='C', fill=True)
-    pdf.ln()
+    # header cells (width, text) encoded once, reused on every page
+    header_cells = [(col_w[i], h if font_used else encode_str(h)) for i, h in enumerate(headers)]
 
-    if font_used:
-        pdf.set_font(font_used, '', 11)
-    else:
-        pdf.set_font('Helvetica', '', 11)
-    for r in rows:
+    def draw_header():
+        pdf.set_font(font_family, 'B', 11)
+        for w, text in header_cells:
+            pdf.cell(w, 8, text, border=1, align='C', fill=True)
+        pdf.ln()
+        pdf.set_font(font_family, '', 11)
+
+    # Cellules de toutes les lignes encodées en une passe, avant de toucher au PDF.
+    # Avec une police unicode, pas d'encodage latin-1 et le symbole € est sûr ; sinon 'EUR'.
+    enc = str if font_used else encode_str
+    # montants : chiffres ASCII + devise, rien à encoder
+    fmt_montant = ('{:.2f} ' + ('€' if font_used else 'EUR')).format
+    prepped = [
+        (enc(r['nom']), enc(r['prenom']), enc(r['classe']), fmt_montant(r['reste_a_payer'] / 100))
+        for r in rows
+    ]
+
+    draw_header()
+    cell, ln = pdf.cell, pdf.ln
+    w_nom, w_prenom, w_classe, w_reste = col_w
+    y_max = pdf.h - pdf.b_margin - 20
+    # position verticale suivie localement (chaque ligne fait 7 mm) plutôt que relue via pdf.get_y()
+    cur_y = pdf.get_y()
+    for nom, prenom, classe, reste in prepped:
         # new page if close to bottom
-        if pdf.get_y() > pdf.h - pdf.b_margin - 20:
+        if cur_y > y_max:
             pdf.add_page()
-            pdf.set_font('Helvetica', 'B', 11)
-            for i, h in enumerate(headers):
-                pdf.cell(col_w[i], 8, encode_str(h), border=1, align='C', fill=True)
-            pdf.ln()
-            pdf.set_font('Helvetica', '', 11)
-
-        pdf.cell(col_w[0], 7, (r['nom'] if font_used else encode_str(r['nom'])), border=1)
-        pdf.cell(col_w[1], 7, (r['prenom'] if font_used else encode_str(r['prenom'])), border=1)
-        pdf.cell(col_w[2], 7, (str(r['classe']) if font_used else encode_str(str(r['classe']))), border=1, align='C')
-        # If we have a unicode font, include the EUR sign directly, otherwise use text 'EUR'
-        if font_used:
-            # Using unicode font — safe to add the euro symbol
-            pdf.cell(col_w[3], 7, f"{r['reste_a_payer']/100:.2f} €", border=1, align='R')
-        else:
-            pdf.cell(col_w[3], 7, encode_str(f"{r['reste_a_payer']/100:.2f} EUR"), border=1, align='R')
-        pdf.ln()
+            draw_header()
+            cur_y = pdf.get_y()
+
+        cell(w_nom, 7, nom, border=1)
+        cell(w_prenom, 7, prenom, border=1)
+        cell(w_classe, 7, classe, border=1, align='C')
+        cell(w_reste, 7, reste, border=1, align='R')
+        ln()
+        cur_y += 7
 
-    output = pdf.output(dest='S')
-    if isinstance(output, bytearray):
-        output = bytes(output)
-    resp = make_response(output)
-    resp.headers.set('Content-Type', 'application/pdf')
-    resp.headers.set('Content-Disposition', f'attachment; filename=liste_inscrits_{voyage["id"]}.pdf')
-    return resp
+    return pdf_response(pdf, f'liste_inscrits_{voyage["id"]}.pdf')
 
 
 @app.route('/voyage/<int:voyage_id>/liste_editable/generer', methods=['POST'])
@@ -784,50 +1353,69 @@ def generer_liste_editable_pdf(voyage_id):
     totals = request.form.getlist('total_paye[]')
 
     # Build list of rows to print
-    rows = []
-    for idx, pid in enumerate(ids):
+    # (identifiant, montant posté) ; un montant manquant vaut 0, les identifiants invalides sont ignorés
+    posted = []
+    for pid, total in zip_longest(ids, totals, fillvalue='0'):
         try:
-            pid_int = int(pid)
+            posted.append((int(pid), total))
         except Exception:
             continue
-        # fetch creance details
-        cre = db.execute('SELECT montant_initial, montant_remise FROM creances WHERE participant_id = ?', (pid_int,)).fetchone()
-        if not cre:
+
+    # participants + créances en une seule requête, puis restitution dans l'ordre posté
+    by_id = {}
+    if posted:
+        valid_ids = list({pid for pid, _ in posted})
+        placeholders = ','.join('?' * len(valid_ids))
+        by_id = {r['id']: r for r in db.execute(
+            f"""
+            SELECT p.id, p.nom, p.prenom, p.classe, c.montant_initial, c.montant_remise
+            FROM participants p
+            JOIN creances c ON c.participant_id = p.id
+            WHERE p.id IN ({placeholders})
+            """, valid_ids).fetchall()}
+
+    rows = []
+    for pid_int, total in posted:
+        participant = by_id.get(pid_int)
+        if not participant:
             continue
-        montant_initial = cre['montant_initial'] or 0
-        montant_remise = cre['montant_remise'] or 0
+        montant_initial = participant['montant_initial'] or 0
+        montant_remise = participant['montant_remise'] or 0
 
         # parse posted paid amount in euros -> cents
         try:
-            paid_euros = float(totals[idx]) if idx < len(totals) else 0.0
-        except Exception:
-            paid_euros = 0.0
-        paid_cents = int(round(paid_euros * 100))
+            paid_cents = euros_str_to_cents(total)
+        except ValueError:
+            paid_cents = 0
 
         reste_cents = max(0, (montant_initial - montant_remise) - paid_cents)
 
-        participant = db.execute('SELECT nom, prenom, classe FROM participants WHERE id = ?', (pid_int,)).fetchone()
-        if participant:
-            rows.append({
-                'nom': participant['nom'],
-                'prenom': participant['prenom'],
-                'classe': participant['classe'],
-                'montant_initial': montant_initial,
-                'montant_remise': montant_remise,
-                'total_paye': paid_cents,
-                'reste_a_payer': reste_cents
-            })
+        rows.append({
+            'nom': participant['nom'],
+            'prenom': participant['prenom'],
+            'classe': participant['classe'],
+            'montant_initial': montant_initial,
+            'montant_remise': montant_remise,
+            'total_paye': paid_cents,
+            'reste_a_payer': reste_cents
+        })
+
+    config = get_config()
+
+    # Moteur HTML (WeasyPrint, si installé) : tout le tableau est mis en page en une passe
+    # par un moteur CSS natif, au lieu d'une cellule FPDF à la fois — utile pour les très longues listes.
+    if request.values.get('engine') == 'html' and WEASYPRINT_AVAILABLE:
+        html = render_template('pdf_liste_inscrits.html', voyage=voyage, rows=rows, config=config)
+        output = WeasyHTML(string=html, base_url=app.config['UPLOAD_FOLDER'] + os.sep).write_pdf()
+        resp = make_response(output)
+        resp.headers.set('Content-Type', 'application/pdf')
+        resp.headers.set('Content-Disposition', 'attachment', filename=f'liste_inscrits_{voyage["id"]}.pdf')
+        return resp
 
     # generate PDF
     pdf = PDF()
     pdf.add_page()
     # draw logo if present
-    try:
-        config_row = db.execute("SELECT * FROM config_etablissement WHERE id = 1").fetchone()
-        config = dict(config_row) if config_row else {}
-    except Exception:
-        config = {}
-
     draw_logo_if_present(pdf, config)
 
     pdf.set_font('Helvetica', 'B', 14)
@@ -847,11 +1435,57 @@ def generer_liste_editable_pdf(voyage_id):
     pdf.ln()
 
     pdf.set_font('Helvetica', '', 10)
+    line_h = 6
+    # largeur des mots mise en cache : la police ne change pas pendant le tableau
+    word_widths = {}
+
+    def wrap_lines(text, width):
+        """Découpe text en lignes tenant dans width (mesure faite une seule fois par mot)."""
+        avail = width - 2 * pdf.c_margin
+        if pdf.get_string_width(text) <= avail:
+            return [text]
+        space_w = pdf.get_string_width(' ')
+        lines, current, current_w = [], '', 0.0
+        for word in text.split():
+            w = word_widths.get(word)
+            if w is None:
+                w = word_widths[word] = pdf.get_string_width(word)
+            if current and current_w + space_w + w > avail:
+                lines.append(current)
+                current, current_w = word, w
+            elif current:
+                current += ' ' + word
+                current_w += space_w + w
+            else:
+                current, current_w = word, w
+        if current:
+            lines.append(current)
+        return lines or ['']
+
+    def write_cell(width, height, lines, align='L'):
+        """Cellule bordée de hauteur fixe ; les textes sur plusieurs lignes sont empilés à l'intérieur."""
+        if len(lines) == 1:
+            pdf.cell(width, height, lines[0], border=1, align=align)
+            return
+        x, y = pdf.get_x(), pdf.get_y()
+        pdf.rect(x, y, width, height)
+        for i, line in enumerate(lines):
+            pdf.set_xy(x, y + i * line_h)
+            pdf.cell(width, line_h, line, align=align)
+        pdf.set_xy(x + width, y)
+
+    # position verticale suivie localement (mise à jour de row_h après chaque ligne) plutôt que relue via pdf.get_y()
+    cur_y = pdf.get_y()
+    y_max = pdf.h - pdf.b_margin - 20
+
     # function to write a row and handle wrapping and page breaks
-    def write_row(row):
-        nonlocal pdf, col_w
+    def write_row(nom, prenom, classe, initial, remise, paye, reste):
+        nonlocal cur_y
+        nom_lines = wrap_lines(nom, col_w[0])
+        prenom_lines = wrap_lines(prenom, col_w[1])
+        row_h = line_h * max(len(nom_lines), len(prenom_lines))
         # check if near bottom, add page
-        if pdf.get_y() > pdf.h - pdf.b_margin - 20:
+        if cur_y + row_h > y_max:
             pdf.add_page()
             # rewrite header on new page
             pdf.set_font('Helvetica', 'B', 11)
@@ -859,36 +1493,33 @@ def generer_liste_editable_pdf(voyage_id):
                 pdf.cell(col_w[i], 7, encode_str(h), border=1, align='C', fill=True)
             pdf.ln()
             pdf.set_font('Helvetica', '', 10)
-
-        # Name
-        pdf.multi_cell(col_w[0], 6, encode_str(row['nom']), border=1)
-        x_after_name = pdf.get_x()
-        y_after_name = pdf.get_y()
-        # Move to the right of name cell to continue on same line for next cells
-        pdf.set_xy(pdf.l_margin + col_w[0], y_after_name - 6)
-        pdf.multi_cell(col_w[1], 6, encode_str(row['prenom']), border=1)
-        pdf.set_xy(pdf.l_margin + col_w[0] + col_w[1], y_after_name - 6)
-        pdf.cell(col_w[2], 6, encode_str(str(row['classe'])), border=1, align='C')
-        pdf.cell(col_w[3], 6, encode_str(f"{row['montant_initial']/100:.2f} €"), border=1, align='R')
-        pdf.cell(col_w[4], 6, encode_str(f"{row['montant_remise']/100:.2f} €"), border=1, align='R')
-        pdf.cell(col_w[5], 6, encode_str(f"{row['total_paye']/100:.2f} €"), border=1, align='R')
-        pdf.cell(col_w[6], 6, encode_str(f"{row['reste_a_payer']/100:.2f} €"), border=1, align='R')
-        pdf.ln()
-
-    for r in rows:
-        # ensure required numeric fields exist
-        r.setdefault('montant_initial', 0)
-        r.setdefault('montant_remise', 0)
-        write_row(r)
+            cur_y = pdf.get_y()
+
+        # toutes les colonnes sur la même ligne, à hauteur fixe
+        write_cell(col_w[0], row_h, nom_lines)
+        write_cell(col_w[1], row_h, prenom_lines)
+        pdf.cell(col_w[2], row_h, classe, border=1, align='C')
+        pdf.cell(col_w[3], row_h, initial, border=1, align='R')
+        pdf.cell(col_w[4], row_h, remise, border=1, align='R')
+        pdf.cell(col_w[5], row_h, paye, border=1, align='R')
+        pdf.cell(col_w[6], row_h, reste, border=1, align='R')
+        pdf.ln(row_h)
+        cur_y += row_h
+
+    # toutes les cellules encodées en une passe avant l'écriture du tableau ;
+    # les montants (chiffres ASCII) sont formatés directement, sans passer par encode_str
+    fmt_montant = '{:.2f} EUR'.format
+    prepped = [
+        (encode_str(r['nom']), encode_str(r['prenom']), encode_str(r['classe']),
+         fmt_montant(r['montant_initial'] / 100), fmt_montant(r['montant_remise'] / 100),
+         fmt_montant(r['total_paye'] / 100), fmt_montant(r['reste_a_payer'] / 100))
+        for r in rows
+    ]
+    for cells in prepped:
+        write_row(*cells)
 
     # Return PDF response
-    output = pdf.output(dest='S')
-    if isinstance(output, bytearray):
-        output = bytes(output)
-    resp = make_response(output)
-    resp.headers.set('Content-Type', 'application/pdf')
-    resp.headers.set('Content-Disposition', f'attachment; filename=liste_inscrits_{voyage["id"]}.pdf')
-    return resp
+    return pdf_response(pdf, f'liste_inscrits_{voyage["id"]}.pdf')
 
 # -------------------------------------------
 #  Route pour valider le remboursement d'un élève
@@ -898,37 +1529,22 @@ def valider_remboursement(participant_id):
     """Valide le remboursement d'un élève (remboursement_validé=1)."""
     db = get_db()
     # Récupérer le participant et sa créance
-    participant = db.execute('SELECT * FROM participants WHERE id = ?', (participant_id,)).fetchone()
+    participant = db.execute(SQL_PARTICIPANT, (participant_id,)).fetchone()
     if not participant:
         abort(404, "Participant non trouvé")
 
-    creance = db.execute('SELECT * FROM creances WHERE participant_id = ?', (participant_id,)).fetchone()
-    if creance:
-        paiements_sum = db.execute('SELECT SUM(montant) as total FROM paiements WHERE creance_id = ?', (creance['id'],)).fetchone()
-        total_paye = paiements_sum['total'] or 0
-    else:
-        total_paye = 0
-
-    # Si l'élève a des sommes versées et est à rembourser, créer un paiement négatif qui matérialise le remboursement
-    if participant['statut'] == 'A_REMBOURSER' and (participant['remboursement_validé'] is None or participant['remboursement_validé'] == 0) and total_paye > 0:
-        # S'assurer qu'il existe un mode de paiement 'Remboursement'
-        mode = db.execute('SELECT id FROM modes_paiement WHERE libelle = ?', ('Remboursement',)).fetchone()
-        if not mode:
-            cur = db.execute("INSERT INTO modes_paiement (libelle) VALUES ('Remboursement')")
-            mode_id = cur.lastrowid
-        else:
-            mode_id = mode['id']
+    # Si l'élève a des sommes versées et est à rembourser, créer un paiement négatif qui matérialise le remboursement.
+    # Le total versé est calculé et le paiement inséré par une seule requête (rien n'est inséré si le total est nul).
+    with db:
+        if participant['statut'] == 'A_REMBOURSER' and (participant['remboursement_validé'] is None or participant['remboursement_validé'] == 0):
+            db.execute(SQL_INSERER_REMBOURSEMENT,
+                       (participant_id, get_mode_paiement_id('Remboursement'), date.today(), f"Remboursement participant {participant_id}"))
 
-        # Inscrire un paiement négatif pour matérialiser le remboursement
-        db.execute('INSERT INTO paiements (creance_id, mode_paiement_id, montant, date, reference) VALUES (?, ?, ?, ?, ?)',
-                   (creance['id'], mode_id, -int(total_paye), date.today(), f"Remboursement participant {participant_id}"))
-
-    # Marquer remboursement validé et mettre le statut à ANNULÉ (fin du processus)
-    db.execute('UPDATE participants SET remboursement_validé = 1, statut = ? WHERE id = ?', ('ANNULÉ', participant_id))
-    db.commit()
+        # Marquer remboursement validé et mettre le statut à ANNULÉ (fin du processus)
+        db.execute('UPDATE participants SET remboursement_validé = 1, statut = ? WHERE id = ?', ('ANNULÉ', participant_id))
 
     voyage_id = participant['voyage_id']
-    return redirect(url_for('voyage_details', voyage_id=voyage_id))
+    return write_ok(redirect(url_for('voyage_details', voyage_id=voyage_id)))
 
 # -------------------------------------------
 #  Gestion des Fonds Sociaux
@@ -956,25 +1572,10 @@ def fonds_sociaux(voyage_id):
     demandes_traitees = [d for d in demandes_raw if d['statut'] in ('VALIDE', 'REFUSE')]
     date_du_jour = date.today().strftime('%Y-%m-%d')
 
-    # Calculs pour l'entête récap
-    participants_raw = db.execute(
-        """
-        SELECT p.*, c.montant_initial, c.montant_remise, c.id as creance_id
-        FROM participants p
-        JOIN creances c ON p.id = c.participant_id
-        WHERE p.voyage_id = ?
-        ORDER BY p.nom, p.prenom
-        """, (voyage_id,)
-    ).fetchall()
-    nb_inscrits = len([p for p in participants_raw if p['statut'] == 'INSCRIT'])
-    total_percu_voyage_cents = 0
-    for participant in participants_raw:
-        paiements = db.execute(
-            'SELECT SUM(montant) as total FROM paiements WHERE creance_id = ?', (participant['creance_id'],)
-        ).fetchone()
-        total_paye_cents = paiements['total'] or 0
-        if participant['statut'] == 'INSCRIT':
-            total_percu_voyage_cents += total_paye_cents
+    # Calculs pour l'entête récap : comptage et total perçu agrégés en SQL (une seule ligne lue)
+    recap = db.execute(SQL_RECAP_INSCRITS, (voyage_id,)).fetchone()
+    nb_inscrits = recap['nb_inscrits']
+    total_percu_voyage_cents = recap['total_percu']
     montant_total_attendu_cents = voyage['nb_participants_attendu'] * voyage['prix_eleve']
     return render_template('fonds_sociaux.html', voyage=voyage, participants=participants, 
                            demandes_en_cours=demandes_en_cours, demandes_traitees=demandes_traitees,
@@ -993,13 +1594,18 @@ def ajouter_demande_fonds_sociaux():
     if not all([voyage_id, participant_id, montant_demande]):
         return redirect(url_for('fonds_sociaux', voyage_id=voyage_id))
 
+    try:
+        montant_demande_cents = euros_str_to_cents(montant_demande)
+    except ValueError:
+        return redirect(url_for('fonds_sociaux', voyage_id=voyage_id))
+
     db = get_db()
     db.execute(
         "INSERT INTO demandes_fonds_sociaux (participant_id, montant_demande, statut) VALUES (?, ?, ?)",
-        (participant_id, int(float(montant_demande) * 100), 'EN_COURS')
+        (participant_id, montant_demande_cents, 'EN_COURS')
     )
     db.commit()
-    return redirect(url_for('fonds_sociaux', voyage_id=voyage_id))
+    return write_ok(redirect(url_for('fonds_sociaux', voyage_id=voyage_id)))
 
 @app.route('/fonds_sociaux/valider/<int:demande_id>', methods=['POST'])
 def valider_demande_fonds_sociaux(demande_id):
@@ -1018,40 +1624,40 @@ def valider_demande_fonds_sociaux(demande_id):
     montant_accorde_cents = 0
     if statut == 'VALIDE':
         montant_accorde_str = request.form.get('montant_accorde')
-        if not montant_accorde_str or float(montant_accorde_str) < 0:
+        try:
+            montant_accorde_cents = euros_str_to_cents(montant_accorde_str) if montant_accorde_str else -1
+        except ValueError:
+            montant_accorde_cents = -1
+        if montant_accorde_cents < 0:
             # Idéalement, renvoyer un message d'erreur
             return redirect(url_for('fonds_sociaux', voyage_id=voyage_id))
-        montant_accorde_cents = int(float(montant_accorde_str) * 100)
     
     date_commission_str = request.form.get('date_commission')
-    date_commission = datetime.strptime(date_commission_str, '%Y-%m-%d').date() if date_commission_str else date.today()
-
-    db.execute(
-        "UPDATE demandes_fonds_sociaux SET montant_accorde = ?, date_commission = ?, statut = ?, is_processed = 1 WHERE id = ?",
-        (montant_accorde_cents, date_commission, statut, demande_id)
-    )
-    
-    # Si la demande est validée avec un montant, créer un paiement de type "FONDS_SOCIAL"
-    if statut == 'VALIDE' and montant_accorde_cents > 0:
-        creance = db.execute('SELECT id FROM creances WHERE participant_id = ?', (demande['participant_id'],)).fetchone()
-        
-        mode_paiement_fs = db.execute('SELECT id FROM modes_paiement WHERE libelle = ?', ('Fonds Social',)).fetchone()
-        if not mode_paiement_fs:
-            cursor = db.execute("INSERT INTO modes_paiement (libelle) VALUES ('Fonds Social')")
-            mode_paiement_fs_id = cursor.lastrowid
-        else:
-            mode_paiement_fs_id = mode_paiement_fs['id']
+    try:
+        date_commission = date.fromisoformat(date_commission_str) if date_commission_str else date.today()
+    except ValueError:
+        return redirect(url_for('fonds_sociaux', voyage_id=voyage_id))
 
+    # Décision, paiement et remise validés en une seule transaction
+    with db:
         db.execute(
-            "INSERT INTO paiements (creance_id, mode_paiement_id, montant, date, reference) VALUES (?, ?, ?, ?, ?)",
-            (creance['id'], mode_paiement_fs_id, montant_accorde_cents, date_commission, f"Commission FS du {date_commission.strftime('%d/%m/%Y')}")
+            "UPDATE demandes_fonds_sociaux SET montant_accorde = ?, date_commission = ?, statut = ?, is_processed = 1 WHERE id = ?",
+            (montant_accorde_cents, date_commission, statut, demande_id)
         )
-        
-        # Mettre à jour la remise dans la créance
-        db.execute("UPDATE creances SET montant_remise = montant_remise + ? WHERE id = ?", (montant_accorde_cents, creance['id']))
 
-    db.commit()
-    return redirect(url_for('fonds_sociaux', voyage_id=voyage_id))
+        # Si la demande est validée avec un montant, créer un paiement de type "FONDS_SOCIAL"
+        if statut == 'VALIDE' and montant_accorde_cents > 0:
+            creance = db.execute(SQL_CREANCE_ID_PAR_PARTICIPANT, (demande['participant_id'],)).fetchone()
+            mode_paiement_fs_id = get_mode_paiement_id('Fonds Social')
+
+            db.execute(
+                SQL_INSERT_PAIEMENT,
+                (creance['id'], mode_paiement_fs_id, montant_accorde_cents, date_commission, f"Commission FS du {date_commission.strftime('%d/%m/%Y')}")
+            )
+
+            # Mettre à jour la remise dans la créance
+            db.execute("UPDATE creances SET montant_remise = montant_remise + ? WHERE id = ?", (montant_accorde_cents, creance['id']))
+    return write_ok(redirect(url_for('fonds_sociaux', voyage_id=voyage_id)))
 
 @app.route('/fonds_sociaux/attestation/<int:demande_id>/pdf')
 def generer_attestation_fs_pdf(demande_id):
@@ -1070,23 +1676,12 @@ def generer_attestation_fs_pdf(demande_id):
         if not demande:
             abort(404, "Demande de fonds social non trouvée.")
         
-        config_row = db.execute("SELECT * FROM config_etablissement WHERE id = 1").fetchone()
-        config = dict(config_row) if config_row else {}
+        config = get_config()
         
-        pdf = PDF(orientation='P', unit='mm', format='A4')
+        pdf = new_attestation_pdf()
         pdf.add_page()
-        # logo si présent (une seule fois)
-        try:
-            draw_logo_if_present(pdf, config)
-        except Exception:
-            pass
-        
-        # En-tête
-        pdf.set_font('Helvetica', 'B', 14)
-        pdf.cell(0, 10, encode_str(config.get('nom_etablissement', 'Nom du Collège')), 0, 1, 'L')
-        pdf.set_font('Helvetica', '', 12)
-        pdf.cell(0, 10, 'Service de Gestion', 0, 1, 'L')
-        pdf.ln(15)
+        # En-tête (logo si présent, une seule fois)
+        draw_letterhead(pdf, config)
         
         # Titre du document
         pdf.set_font('Helvetica', 'B', 16)
@@ -1096,14 +1691,15 @@ def generer_attestation_fs_pdf(demande_id):
         # Informations
         pdf.set_font('Helvetica', '', 12)
         info_participant = f"Eleve {demande['prenom']} {demande['nom']} (Classe de {demande['classe']})" if demande['type'] == 'ELEVE' else f"{demande['prenom']} {demande['nom']}"
-        pdf.multi_cell(content_width(pdf), 8, encode_str(f"Concerne : {info_participant}"))
+        cw = content_width(pdf)
+        pdf.multi_cell(cw, 8, encode_str(f"Concerne : {info_participant}"))
         pdf.ln(2)
         date_depart_str = demande['date_depart'].strftime('%d/%m/%Y') if demande['date_depart'] else 'N/A'
-        pdf.multi_cell(content_width(pdf), 8, encode_str(f"Voyage : {demande['destination']} (Depart le {date_depart_str})"))
+        pdf.multi_cell(cw, 8, encode_str(f"Voyage : {demande['destination']} (Depart le {date_depart_str})"))
         pdf.ln(15)
         
         # Corps du texte
-        pdf.multi_cell(content_width(pdf), 7, "Madame, Monsieur,")
+        pdf.multi_cell(cw, 7, "Madame, Monsieur,")
         pdf.ln(5)
         
         date_commission_str = demande['date_commission'].strftime('%d/%m/%Y') if demande['date_commission'] else 'non specifiee'
@@ -1112,38 +1708,25 @@ def generer_attestation_fs_pdf(demande_id):
             montant_accorde_cents = demande['montant_accorde'] if demande['montant_accorde'] is not None else 0
             montant_accorde_euros = montant_accorde_cents / 100.0
             texte = f"Suite a la commission du {date_commission_str}, nous avons le plaisir de vous informer qu'une aide financiere de {montant_accorde_euros:.2f} EUR vous a ete accordee pour la participation au voyage scolaire."
-            pdf.multi_cell(content_width(pdf), 7, encode_str(texte))
+            pdf.multi_cell(cw, 7, encode_str(texte))
         elif demande['statut'] == 'REFUSE':
             texte = f"Suite a la commission du {date_commission_str}, nous sommes au regret de vous informer que votre demande d'aide financiere n'a pas pu recevoir un avis favorable."
-            pdf.multi_cell(content_width(pdf), 7, encode_str(texte))
+            pdf.multi_cell(cw, 7, encode_str(texte))
         
         pdf.ln(10)
         if demande['statut'] == 'VALIDE':
-            pdf.multi_cell(content_width(pdf), 7, encode_str("Cette somme sera directement deduite du montant total a votre charge."))
+            pdf.multi_cell(cw, 7, encode_str("Cette somme sera directement deduite du montant total a votre charge."))
         pdf.ln(10)
         
         # Pied de page avec signatures
-        pdf.set_font('Helvetica', '', 11)
-        pdf.cell(0, 7, encode_str(f"Fait a {config.get('ville_signature', 'Ville')}, le {datetime.now().strftime('%d/%m/%Y')}"), 0, 1, 'R')
-        pdf.ln(15)
-        draw_signature_pair(pdf, config, 'ordonnateur_image', config.get('ordonnateur_nom', 'Le Principal,'),
-                    'secretaire_image', config.get('secretaire_general_nom', 'Le Secrétaire Général,'), img_mm=22.6)
+        draw_signoff(pdf, config)
         
         filename = f"attestation_fs_{sanitize_filename(demande['nom'])}_{sanitize_filename(demande['prenom'])}.pdf"
-        _buf = pdf.output(dest='S')
-        if isinstance(_buf, (bytes, bytearray)):
-            _data = bytes(_buf)
-        else:
-            _data = _buf.encode('latin-1')
-        response = make_response(_data)
-        response.headers.set('Content-Disposition', 'attachment', filename=filename)
-        response.headers.set('Content-Type', 'application/pdf')
-        return response
+        return pdf_response(pdf, filename)
         
-    except Exception as e:
-        import traceback
-        print(traceback.format_exc())
-        return f"<pre>Erreur lors de la generation du PDF: {e}\n{traceback.format_exc()}</pre>", 500
+    except Exception:
+        logger.exception("Erreur lors de la generation du PDF")
+        return "Erreur lors de la generation du PDF.", 500
 
 # -------------------------------------------
 #  Gestion des voyages
@@ -1163,17 +1746,21 @@ def ajouter_voyage():
         # On pourrait ajouter un message flash pour l'utilisateur ici
         return redirect(url_for('index'))
 
-    date_depart = datetime.strptime(date_depart_str, '%Y-%m-%d').date()
+    try:
+        date_depart = date.fromisoformat(date_depart_str)
+        prix_eleve_cents = euros_str_to_cents(prix_eleve)
+    except ValueError:
+        return redirect(url_for('index'))
 
     db = get_db()
     db.execute(
         """INSERT INTO voyages 
            (destination, date_depart, prix_eleve, nb_participants_attendu, nb_accompagnateurs, duree_sejour_nuits) 
            VALUES (?, ?, ?, ?, ?, ?)""",
-        (destination, date_depart, int(float(prix_eleve) * 100), int(nb_participants), int(nb_accompagnateurs), int(duree_sejour_nuits))
+        (destination, date_depart, prix_eleve_cents, int(nb_participants), int(nb_accompagnateurs), int(duree_sejour_nuits))
     )
     db.commit()
-    return redirect(url_for('index'))
+    return write_ok(redirect(url_for('index')))
 
 @app.route('/voyage/<int:voyage_id>/modifier', methods=['GET', 'POST'])
 def modifier_voyage(voyage_id):
@@ -1193,7 +1780,11 @@ def modifier_voyage(voyage_id):
             # Idéalement, utiliser des messages flash pour les erreurs
             return redirect(url_for('modifier_voyage', voyage_id=voyage_id))
 
-        date_depart = datetime.strptime(date_depart_str, '%Y-%m-%d').date()
+        try:
+            date_depart = date.fromisoformat(date_depart_str)
+            prix_eleve_cents = euros_str_to_cents(prix_eleve)
+        except ValueError:
+            return redirect(url_for('modifier_voyage', voyage_id=voyage_id))
 
         db.execute(
             """
@@ -1202,10 +1793,10 @@ def modifier_voyage(voyage_id):
                 nb_accompagnateurs = ?, duree_sejour_nuits = ?
             WHERE id = ?
             """,
-            (destination, date_depart, int(float(prix_eleve) * 100), int(nb_participants), int(nb_accompagnateurs), int(duree_sejour_nuits), voyage_id)
+            (destination, date_depart, prix_eleve_cents, int(nb_participants), int(nb_accompagnateurs), int(duree_sejour_nuits), voyage_id)
         )
         db.commit()
-        return redirect(url_for('voyage_details', voyage_id=voyage_id))
+        return write_ok(redirect(url_for('voyage_details', voyage_id=voyage_id)))
 
     return render_template('modifier_voyage.html', voyage=voyage)
 
@@ -1217,24 +1808,25 @@ def supprimer_voyage(voyage_id):
     
     db = get_db()
 
-    # 1. Récupérer les chemins des fichiers à supprimer
-    docs_a_supprimer = db.execute(
-        'SELECT chemin_stockage FROM documents WHERE voyage_id = ?', (voyage_id,)
-    ).fetchall()
+    with db:
+        # 1. Récupérer les chemins des fichiers à supprimer
+        docs_a_supprimer = db.execute(
+            'SELECT chemin_stockage FROM documents WHERE voyage_id = ?', (voyage_id,)
+        ).fetchall()
 
-    # 2. Supprimer le voyage de la DB (ce qui supprime en cascade élèves, paiements, documents, etc.)
-    db.execute('DELETE FROM voyages WHERE id = ?', (voyage_id,))
-    db.commit()
+        # 2. Supprimer le voyage de la DB (ce qui supprime en cascade élèves, paiements, documents, etc.)
+        db.execute('DELETE FROM voyages WHERE id = ?', (voyage_id,))
+
+    # 3. Supprimer les fichiers physiques, une fois la transaction validée
+    #    (un seul appel système par fichier : pas de test d'existence préalable)
+    for chemin in {doc['chemin_stockage'] for doc in docs_a_supprimer}:
+        try:
+            os.remove(os.path.join(app.config['UPLOAD_FOLDER'], chemin))
+        except FileNotFoundError:
+            pass
 
-    # 3. Supprimer les fichiers physiques
-    for doc in docs_a_supprimer:
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], doc['chemin_stockage'])
-        if os.path.exists(file_path):
-            os.remove(file_path)
-    db.commit()
-    
     # Après la suppression, on redirige vers la page d'accueil.
-    return redirect(url_for('index'))
+    return write_ok(redirect(url_for('index')))
 
 # -------------------------------------------
 #  Gestion des participants
@@ -1247,38 +1839,20 @@ def ajouter_participant():
     nom = request.form['nom']
     prenom = request.form['prenom']
     classe = request.form['classe']
-    # Pour l'instant, on n'ajoute que des élèves
-    type_participant = 'ELEVE'
 
     if not all([voyage_id, nom, prenom, classe]):
         # Redirection avec un message d'erreur serait mieux
         return redirect(url_for('voyage_details', voyage_id=voyage_id))
 
     db = get_db()
-    voyage = get_voyage(voyage_id)
-    nb_inscrits = db.execute(
-        'SELECT COUNT(id) FROM participants WHERE voyage_id = ? AND statut = ?', (voyage_id, 'INSCRIT')
-    ).fetchone()[0]
-
-    # Si le nombre d'inscrits est déjà atteint, le nouvel élève passe en liste d'attente
-    statut_initial = 'INSCRIT' if nb_inscrits < voyage['nb_participants_attendu'] else 'LISTE_ATTENTE'
-
-    cursor = db.cursor()
-    cursor.execute(
-        "INSERT INTO participants (voyage_id, nom, prenom, classe, type, statut) VALUES (?, ?, ?, ?, ?, ?)",
-        (voyage_id, nom, prenom, classe, type_participant, statut_initial)
-    )
-    participant_id = cursor.lastrowid
-    
-    # Créer la créance associée
-    montant_initial = voyage['prix_eleve']
-    cursor.execute(
-        "INSERT INTO creances (participant_id, montant_initial) VALUES (?, ?)",
-        (participant_id, montant_initial)
-    )
-    
-    db.commit()
-    return redirect(url_for('voyage_details', voyage_id=voyage_id))
+    # Pour l'instant, on n'ajoute que des élèves ; participant et créance associée validés ensemble
+    with db:
+        row = db.execute(SQL_INSERT_ELEVE, (nom, prenom, classe, voyage_id)).fetchone()
+        if row is not None:
+            db.execute(SQL_INSERT_CREANCE_PRIX_VOYAGE, (row['id'], voyage_id))
+    if row is None:
+        abort(404, f"Le voyage avec l'ID {voyage_id} n'existe pas.")
+    return write_ok(redirect(url_for('voyage_details', voyage_id=voyage_id)))
 
 @app.route('/participant/statut', methods=['POST'])
 def modifier_statut_participant():
@@ -1291,18 +1865,18 @@ def modifier_statut_participant():
     final_statut = nouveau_statut
 
     if nouveau_statut == 'ANNULÉ':
-        creance = db.execute('SELECT id FROM creances WHERE participant_id = ?', (participant_id,)).fetchone()
+        creance = db.execute(SQL_CREANCE_ID_PAR_PARTICIPANT, (participant_id,)).fetchone()
         if creance:
             result = db.execute(
-                'SELECT SUM(montant) as total FROM paiements WHERE creance_id = ?', (creance['id'],)
+                SQL_TOTAL_PAIEMENTS, (creance['id'],)
             ).fetchone()
             total_paye = result['total'] if result and result['total'] is not None else 0
             if total_paye > 0:
                 final_statut = 'A_REMBOURSER'
 
-    db.execute('UPDATE participants SET statut = ? WHERE id = ?', (final_statut, participant_id))
+    db.execute(SQL_UPDATE_STATUT_PARTICIPANT, (final_statut, participant_id))
     db.commit()
-    return redirect(url_for('voyage_details', voyage_id=voyage_id))
+    return write_ok(redirect(url_for('voyage_details', voyage_id=voyage_id)))
 
 @app.route('/participant/toggle_validation', methods=['POST'])
 def toggle_validation():
@@ -1311,22 +1885,20 @@ def toggle_validation():
     participant_id = data.get('participant_id')
     field = data.get('field')
 
-    # Sécurité : ne permettre que la modification des champs prévus
-    if field not in ['fiche_engagement', 'liste_definitive']:
+    # Sécurité : seules les requêtes prévues peuvent être exécutées, aucun nom de champ n'est interpolé
+    sql = SQL_TOGGLE_VALIDATION.get(field)
+    if sql is None:
         return {"status": "error", "message": "Champ non valide"}, 400
 
     if not participant_id:
         return {"status": "error", "message": "ID du participant manquant"}, 400
 
     db = get_db()
-    # On récupère la valeur actuelle pour l'inverser (0 -> 1, 1 -> 0)
-    current_value = db.execute(
-        f'SELECT {field} FROM participants WHERE id = ?', (participant_id,)
-    ).fetchone()[0]
-
-    new_value = 1 - current_value
-
-    db.execute(f'UPDATE participants SET {field} = ? WHERE id = ?', (new_value, participant_id))
+    # Inversion (0 -> 1, 1 -> 0) et lecture de la nouvelle valeur en une seule requête
+    row = db.execute(sql, (participant_id,)).fetchone()
+    if row is None:
+        return {"status": "error", "message": "Participant introuvable"}, 404
+    new_value = row[0]
     db.commit()
 
     return {"status": "success", "new_value": new_value}
@@ -1338,13 +1910,14 @@ def participant_paiements(participant_id):
     voyage = get_voyage(participant['voyage_id'])
     db = get_db()
     
-    creance = db.execute('SELECT * FROM creances WHERE participant_id = ?', (participant_id,)).fetchone()
+    creance = db.execute(SQL_CREANCE_PAR_PARTICIPANT, (participant_id,)).fetchone()
     if not creance:
         abort(404, "Créance non trouvée pour ce participant.")
 
     paiements = db.execute(
         """
-        SELECT p.id, p.montant, p.date, p.reference, mp.libelle as mode_paiement
+        SELECT p.id, p.montant, p.date, p.reference, mp.libelle as mode_paiement,
+               SUM(p.montant) OVER () as total_paye
         FROM paiements p
         JOIN modes_paiement mp ON p.mode_paiement_id = mp.id
         WHERE p.creance_id = ?
@@ -1353,8 +1926,8 @@ def participant_paiements(participant_id):
         (creance['id'],)
     ).fetchall()
 
-    paiements_euros = [{'montant': p['montant'] / 100.0, **p} for p in paiements]
-    total_paye_cents = sum(p['montant'] for p in paiements)
+    # Total calculé par la requête (fonction de fenêtre), répété sur chaque ligne
+    total_paye_cents = paiements[0]['total_paye'] if paiements else 0
     solde_a_payer_cents = creance['montant_initial'] - creance['montant_remise']
     reste_a_payer_cents = max(0, solde_a_payer_cents - total_paye_cents)
     # Si le participant est à rembourser, la somme à rembourser est ce qu'il a déjà versé
@@ -1363,7 +1936,7 @@ def participant_paiements(participant_id):
     else:
         a_rembourser_cents = max(0, total_paye_cents - solde_a_payer_cents)
 
-    modes_paiement = db.execute('SELECT * FROM modes_paiement ORDER BY libelle').fetchall()
+    modes_paiement = get_reference_rows(SQL_MODES_PAIEMENT)
     
     return render_template(
         'participant_paiements.html',
@@ -1384,38 +1957,28 @@ def generer_attestation_pdf(participant_id):
         participant = get_participant(participant_id)
         voyage = get_voyage(participant['voyage_id'])
         
-        config_row = db.execute("SELECT * FROM config_etablissement WHERE id = 1").fetchone()
-        config = dict(config_row) if config_row else {}
+        config = get_config()
         
-        creance = db.execute('SELECT id FROM creances WHERE participant_id = ?', (participant_id,)).fetchone()
+        creance = db.execute(SQL_CREANCE_ID_PAR_PARTICIPANT, (participant_id,)).fetchone()
         if not creance:
             abort(404, "Créance non trouvée.")
 
         paiements = db.execute(
             """
-            SELECT p.montant, p.date, mp.libelle as mode_paiement
+            SELECT p.montant, p.date, mp.libelle as mode_paiement, SUM(p.montant) OVER () as total_paye
             FROM paiements p JOIN modes_paiement mp ON p.mode_paiement_id = mp.id
             WHERE p.creance_id = ? ORDER BY p.date
             """, (creance['id'],)
         ).fetchall()
 
-        total_paye_cents = sum(p['montant'] for p in paiements)
+        total_paye_cents = paiements[0]['total_paye'] if paiements else 0
 
-        pdf = PDF(orientation='P', unit='mm', format='A4')
+        pdf = new_attestation_pdf()
         pdf.add_page()
-        try:
-            draw_logo_if_present(pdf, config)
-        except Exception:
-            pass
         # Ne pas redéfinir set_auto_page_break pour éviter les conflits
-        
 
         # En-tête amélioré
-        pdf.set_font('Helvetica', 'B', 15)
-        pdf.cell(0, 10, encode_str(config.get('nom_etablissement', 'Nom du Collège')), 0, 1, 'C')
-        pdf.set_font('Helvetica', '', 12)
-        pdf.cell(0, 8, 'Service de Gestion', 0, 1, 'C')
-        pdf.ln(4)
+        draw_letterhead(pdf, config, align='C', name_size=15, service_h=8, space_after=4)
 
         # Titre
         pdf.set_font('Helvetica', 'B', 16)
@@ -1433,13 +1996,14 @@ def generer_attestation_pdf(participant_id):
         pdf.ln(8)
 
         # Texte de l'attestation en "paysage" (largeur max, style encadré)
+        cw = content_width(pdf)
         texte_attestation = config.get('texte_attestation', '')
         if texte_attestation:
             pdf.set_font('Helvetica', 'B', 13)
             y_before = pdf.get_y()
             # Encadré sur toute la largeur utile
             pdf.set_fill_color(240, 240, 240)
-            pdf.multi_cell(content_width(pdf), 10, encode_str(texte_attestation), border=1, align='C', fill=True)
+            pdf.multi_cell(cw, 10, encode_str(texte_attestation), border=1, align='C', fill=True)
             y_after = pdf.get_y()
             pdf.ln(8)
 
@@ -1447,7 +2011,6 @@ def generer_attestation_pdf(participant_id):
 
         # Tableau des paiements : utiliser la largeur de contenu pour calculer les colonnes
         pdf.set_font('Helvetica', 'B', 11)
-        cw = content_width(pdf)
         # Répartition raisonnable : date 20%, mode 60%, montant 20%
         date_w = round(cw * 0.20)
         mode_w = round(cw * 0.60)
@@ -1458,11 +2021,15 @@ def generer_attestation_pdf(participant_id):
         pdf.cell(mode_w, 10, 'Mode de paiement', 1, 0, 'C')
         pdf.cell(amount_w, 10, 'Montant', 1, 1, 'C')
 
+        # Lignes préparées avant le dessin (dates, libellés et montants déjà formatés)
+        lignes = [(p['date'].strftime('%d/%m/%Y'), encode_str(p['mode_paiement']),
+                   f"{p['montant'] / 100.0:.2f} EUR") for p in paiements]
         pdf.set_font('Helvetica', '', 10)
-        for p in paiements:
-            pdf.cell(date_w, 10, p['date'].strftime('%d/%m/%Y'), 1, 0, 'C')
-            pdf.cell(mode_w, 10, encode_str(p['mode_paiement']), 1, 0, 'L')
-            pdf.cell(amount_w, 10, f"{p['montant'] / 100.0:.2f} EUR", 1, 1, 'R')
+        cell = pdf.cell
+        for date_txt, mode_txt, montant_txt in lignes:
+            cell(date_w, 10, date_txt, 1, 0, 'C')
+            cell(mode_w, 10, mode_txt, 1, 0, 'L')
+            cell(amount_w, 10, montant_txt, 1, 1, 'R')
 
         # Total - aligné au tableau (cumuler date+mode pour la colonne label)
         pdf.set_font('Helvetica', 'B', 10)
@@ -1472,29 +2039,14 @@ def generer_attestation_pdf(participant_id):
 
 
         # Footer
-        pdf.set_font('Helvetica', '', 11)
-        date_jour = date.today().strftime('%d/%m/%Y')
         pdf.ln(5)
-        pdf.cell(0, 7, encode_str(f"Fait à {config.get('ville_signature', 'Ville')}, le {date_jour}"), 0, 1, 'R')
-        pdf.ln(12)
-        draw_signature_pair(pdf, config, 'ordonnateur_image', config.get('ordonnateur_nom', 'Le Principal,'),
-                    'secretaire_image', config.get('secretaire_general_nom', 'Le Secrétaire Général,'), img_mm=22.6)
+        draw_signoff(pdf, config, space_after=12)
 
-        _buf = pdf.output(dest='S')
-        if isinstance(_buf, (bytes, bytearray)):
-            _data = bytes(_buf)
-        else:
-            _data = _buf.encode('latin-1')
-        response = make_response(_data)
         filename = f"attestation_{sanitize_filename(participant['nom'])}_{sanitize_filename(participant['prenom'])}.pdf"
-        response.headers.set('Content-Disposition', 'attachment', filename=filename)
-        response.headers.set('Content-Type', 'application/pdf')
-        
-        return response
-    except Exception as e:
-        import traceback
-        print(traceback.format_exc())
-        return f"<pre>Erreur lors de la génération du PDF: {e}\n{traceback.format_exc()}</pre>", 500
+        return pdf_response(pdf, filename)
+    except Exception:
+        logger.exception("Erreur lors de la génération du PDF")
+        return "Erreur lors de la génération du PDF.", 500
 
 
 @app.route('/participant/<int:participant_id>/attestation_remboursement/pdf')
@@ -1505,15 +2057,15 @@ def generer_attestation_remboursement_pdf(participant_id):
         participant = get_participant(participant_id)
         voyage = get_voyage(participant['voyage_id'])
 
-        creance = db.execute('SELECT * FROM creances WHERE participant_id = ?', (participant_id,)).fetchone()
+        creance = db.execute(SQL_CREANCE_PAR_PARTICIPANT, (participant_id,)).fetchone()
         if not creance:
             abort(404, 'Créance non trouvée pour ce participant.')
 
         # Somme des paiements positifs (montants versés)
-        paiements_sum_pos = db.execute('SELECT SUM(montant) as total FROM paiements WHERE creance_id = ? AND montant > 0', (creance['id'],)).fetchone()
+        paiements_sum_pos = db.execute(SQL_TOTAL_VERSEMENTS, (creance['id'],)).fetchone()
         total_pos = paiements_sum_pos['total'] or 0
         # Somme des paiements négatifs correspondant à remboursement
-        paiements_sum_neg = db.execute("SELECT SUM(montant) as total FROM paiements WHERE creance_id = ? AND montant < 0 AND reference LIKE '%Remboursement%'", (creance['id'],)).fetchone()
+        paiements_sum_neg = db.execute(SQL_TOTAL_REMBOURSEMENTS, (creance['id'],)).fetchone()
         total_neg = abs(paiements_sum_neg['total'] or 0)
 
         # Montant à afficher sur l'attestation : si remboursement déjà effectué -> montant remboursé, sinon montant versé
@@ -1527,55 +2079,45 @@ def generer_attestation_remboursement_pdf(participant_id):
             return render_template('message.html', title='Attestation indisponible',
                                    message='Aucun paiement trouvé à attester pour ce participant.'), 400
 
-        config_row = db.execute('SELECT * FROM config_etablissement WHERE id = 1').fetchone()
-        config = dict(config_row) if config_row else {}
+        config = get_config()
 
         montant_euros = montant_a_attester_cents / 100.0
 
-        pdf = PDF(orientation='P', unit='mm', format='A4')
+        pdf = new_attestation_pdf()
         pdf.add_page()
-        try:
-            draw_logo_if_present(pdf, config)
-        except Exception:
-            pass
-        pdf.set_font('Helvetica', 'B', 14)
-        pdf.cell(0, 10, encode_str(config.get('nom_etablissement', 'Nom du Collège')), 0, 1, 'L')
-        pdf.set_font('Helvetica', '', 12)
-        pdf.cell(0, 8, 'Service de Gestion', 0, 1, 'L')
-        pdf.ln(10)
+        draw_letterhead(pdf, config, service_h=8, space_after=10)
 
         pdf.set_font('Helvetica', 'B', 16)
         pdf.cell(0, 12, 'Attestation de remboursement', 0, 1, 'C')
         pdf.ln(6)
 
         pdf.set_font('Helvetica', '', 12)
-        pdf.multi_cell(content_width(pdf), 7, encode_str(
+        cw = content_width(pdf)
+        pdf.multi_cell(cw, 7, encode_str(
             f"Nous attestons que la somme de {montant_euros:.2f} EUR sera remboursée à Monsieur/Madame {participant['nom']} {participant['prenom']} pour le voyage {voyage['destination']} (départ {voyage['date_depart'].strftime('%d/%m/%Y') if voyage['date_depart'] else 'N/A'})."
         ))
         pdf.ln(8)
-        pdf.multi_cell(content_width(pdf), 7, encode_str("Cette attestation certifie la prise en charge du remboursement par le service de gestion. Conservez-la pour vos archives."))
+        pdf.multi_cell(cw, 7, encode_str("Cette attestation certifie la prise en charge du remboursement par le service de gestion. Conservez-la pour vos archives."))
         pdf.ln(12)
 
-        pdf.cell(0, 7, encode_str(f"Fait à {config.get('ville_signature', 'Ville')}, le {datetime.now().strftime('%d/%m/%Y')}"), 0, 1, 'R')
-        pdf.ln(15)
-        draw_signature_pair(pdf, config, 'ordonnateur_image', config.get('ordonnateur_nom', 'Le Principal,'),
-                    'secretaire_image', config.get('secretaire_general_nom', 'Le Secrétaire Général,'), img_mm=22.6)
+        draw_signoff(pdf, config, font_size=12)
 
         filename = f"attestation_remboursement_{sanitize_filename(participant['nom'])}_{sanitize_filename(participant['prenom'])}.pdf"
-        _buf = pdf.output(dest='S')
-        if isinstance(_buf, (bytes, bytearray)):
-            _data = bytes(_buf)
-        else:
-            _data = _buf.encode('latin-1')
-        response = make_response(_data)
-        response.headers.set('Content-Disposition', 'attachment', filename=filename)
-        response.headers.set('Content-Type', 'application/pdf')
-        return response
+        return pdf_response(pdf, filename)
 
-    except Exception as e:
-        import traceback
-        print(traceback.format_exc())
-        return f"<pre>Erreur lors de la génération de l'attestation de remboursement: {e}\n{traceback.format_exc()}</pre>", 500
+    except Exception:
+        logger.exception("Erreur lors de la génération de l'attestation de remboursement")
+        return "Erreur lors de la génération de l'attestation de remboursement.", 500
+
+# Colonnes du tableau de generer_liste_participants_pdf : (largeur en mm, en-tête, alignement des lignes)
+LISTE_PARTICIPANTS_COLS = (
+    (40, 'Nom', 'L'),
+    (40, 'Prénom', 'L'),
+    (30, 'Classe/Fonction', 'C'),
+    (40, 'Statut', 'C'),
+    (35, 'Total Payé', 'R'),
+    (35, 'Reste à Payer', 'R'),
+)
 
 @app.route('/voyage/<int:voyage_id>/liste_participants_pdf', methods=['POST'])
 def generer_liste_participants_pdf(voyage_id):
@@ -1584,48 +2126,28 @@ def generer_liste_participants_pdf(voyage_id):
     voyage = get_voyage(voyage_id)
     db = get_db()
 
-    # 1. Récupérer tous les participants avec leurs détails financiers
-    participants_raw = db.execute(
-        """
-        SELECT p.*, c.montant_initial, c.montant_remise, c.id as creance_id
-        FROM participants p
-        JOIN creances c ON p.id = c.participant_id
-        WHERE p.voyage_id = ?
-        ORDER BY p.nom, p.prenom
-        """, (voyage_id,)
-    ).fetchall()
+    # 1. Récupérer tous les participants avec leurs détails financiers et le total payé (une seule requête)
+    participants_raw = db.execute(SQL_PARTICIPANTS_FINANCES, (voyage_id,)).fetchall()
+
+    # Les sqlite3.Row sont utilisées telles quelles (pas de dict(row) par ligne) : seuls
+    # les montants calculés les accompagnent, en euros
+    participants_details = [(p, p['total_paye'] / 100.0, p['reste_a_payer'] / 100.0) for p in participants_raw]
 
-    participants_details = []
-    for p in participants_raw:
-        p_dict = dict(p)
-        paiements = db.execute('SELECT SUM(montant) as total FROM paiements WHERE creance_id = ?', (p['creance_id'],)).fetchone()
-        total_paye_cents = paiements['total'] or 0
-        solde_a_payer_cents = p['montant_initial'] - p['montant_remise']
-        
-        p_dict['total_paye'] = total_paye_cents / 100.0
-        p_dict['reste_a_payer'] = max(0, (solde_a_payer_cents - total_paye_cents) / 100.0)
-        participants_details.append(p_dict)
-        
     # 2. Appliquer le filtre
     if filtre == 'paye':
-        participants_filtres = [p for p in participants_details if p['statut'] == 'INSCRIT' and p['reste_a_payer'] <= 0]
+        participants_filtres = [d for d in participants_details if d[0]['statut'] == 'INSCRIT' and d[2] <= 0]
         titre_filtre = " (Paiements soldés)"
     elif filtre == 'non_paye':
-        participants_filtres = [p for p in participants_details if p['statut'] == 'INSCRIT' and p['reste_a_payer'] > 0]
+        participants_filtres = [d for d in participants_details if d[0]['statut'] == 'INSCRIT' and d[2] > 0]
         titre_filtre = " (Paiements en attente)"
     else: # 'tous'
         participants_filtres = participants_details
         titre_filtre = " (Tous les statuts)"
 
     # 3. Générer le PDF
-    config_row = db.execute("SELECT * FROM config_etablissement WHERE id = 1").fetchone()
-    config = dict(config_row) if config_row else {}
+    config = get_config()
     pdf = PDF(orientation='L', unit='mm', format='A4')
     pdf.add_page()
-    try:
-        draw_logo_if_present(pdf, config)
-    except Exception:
-        pass
     # Dessine une seule fois le logo si présent
     try:
         draw_logo_if_present(pdf, config)
@@ -1637,42 +2159,40 @@ def generer_liste_participants_pdf(voyage_id):
     pdf.cell(0, 10, encode_str(f"Filtre appliqué : {titre_filtre}"), 0, 1, 'C')
     pdf.ln(10)
 
+    def entetes():
+        pdf.set_font('Helvetica', 'B', 10)
+        for w, titre, _ in LISTE_PARTICIPANTS_COLS:
+            pdf.cell(w, 10, titre, 1, 0, 'C')
+        pdf.ln(10)
+        pdf.set_font('Helvetica', '', 10)
+
     # En-têtes du tableau
-    pdf.set_font('Helvetica', 'B', 10)
-    pdf.cell(40, 10, 'Nom', 1, 0, 'C')
-    pdf.cell(40, 10, 'Prénom', 1, 0, 'C')
-    pdf.cell(30, 10, 'Classe/Fonction', 1, 0, 'C')
-    pdf.cell(40, 10, 'Statut', 1, 0, 'C')
-    pdf.cell(35, 10, 'Total Payé', 1, 0, 'C')
-    pdf.cell(35, 10, 'Reste à Payer', 1, 1, 'C')
-
-    # Lignes du tableau
-    pdf.set_font('Helvetica', '', 10)
-    for p in participants_filtres:
-        pdf.cell(40, 10, encode_str(p['nom']), 1)
-        pdf.cell(40, 10, encode_str(p['prenom']), 1)
-        info = p['classe'] if p['type'] == 'ELEVE' else p['fonction']
-        pdf.cell(30, 10, encode_str(info or ''), 1, 0, 'C')
-        pdf.cell(40, 10, encode_str(p['statut'].replace('_', ' ').title()), 1, 0, 'C')
-        pdf.cell(35, 10, f"{p['total_paye']:.2f} EUR", 1, 0, 'R')
-        pdf.cell(35, 10, f"{p['reste_a_payer']:.2f} EUR", 1, 1, 'R')
+    entetes()
+
+    # Lignes du tableau : toutes les valeurs préparées d'abord, puis une seule boucle d'écriture
+    lignes = [
+        (encode_str(p['nom']), encode_str(p['prenom']),
+         encode_str((p['classe'] if p['type'] == 'ELEVE' else p['fonction']) or ''),
+         encode_str(p['statut'].replace('_', ' ').title()),
+         f"{total_paye:.2f} EUR", f"{reste_a_payer:.2f} EUR")
+        for p, total_paye, reste_a_payer in participants_filtres
+    ]
+    colonnes = [(w, align) for w, _, align in LISTE_PARTICIPANTS_COLS]
+    cell, ln = pdf.cell, pdf.ln
+    # Le tableau est découpé page par page : saut de page explicite avant la ligne qui
+    # déborderait, puis en-têtes redessinés (au lieu du saut automatique en milieu de ligne)
+    for valeurs in lignes:
+        if pdf.will_page_break(10):
+            pdf.add_page()
+            entetes()
+        for (w, align), v in zip(colonnes, valeurs):
+            cell(w, 10, v, 1, 0, align)
+        ln(10)
 
     pdf.ln(8)
-    pdf.set_font('Helvetica', '', 11)
-    pdf.cell(0, 7, encode_str(f"Fait à {config.get('ville_signature', 'Ville')}, le {date.today().strftime('%d/%m/%Y')}"), 0, 1, 'R')
-    pdf.ln(8)
-    draw_signature_pair(pdf, config, 'ordonnateur_image', config.get('ordonnateur_nom', 'Le Principal,'),
-                'secretaire_image', config.get('secretaire_general_nom', 'Le Secrétaire Général,'), img_mm=22.6)
+    draw_signoff(pdf, config, space_after=8)
 
-    _buf = pdf.output(dest='S')
-    if isinstance(_buf, (bytes, bytearray)):
-        _data = bytes(_buf)
-    else:
-        _data = _buf.encode('latin-1')
-    response = make_response(_data)
-    response.headers.set('Content-Disposition', 'attachment', filename=f"liste_participants_{sanitize_filename(voyage['destination'])}_{filtre}.pdf")
-    response.headers.set('Content-Type', 'application/pdf')
-    return response
+    return pdf_response(pdf, f"liste_participants_{sanitize_filename(voyage['destination'])}_{filtre}.pdf")
 
 @app.route('/voyage/<int:voyage_id>/generer_echeancier_pdf', methods=['POST'])
 def generer_echeancier_pdf(voyage_id):
@@ -1680,46 +2200,33 @@ def generer_echeancier_pdf(voyage_id):
     voyage = get_voyage(voyage_id)
     db = get_db()
 
-    config_row = db.execute("SELECT * FROM config_etablissement WHERE id = 1").fetchone()
-    config = dict(config_row) if config_row else {}
+    config = get_config()
 
     # Récupérer les données du formulaire
     methode_calcul = request.form.get('methode_calcul')
     prix_total_euros = voyage['prix_eleve'] / 100.0
-    echeances = []
+    montants = []
 
     if methode_calcul == 'nombre':
         nombre = int(request.form.get('nombre_echeances', 1))
         if nombre > 0:
-            montant_echeance = prix_total_euros / nombre
-            for i in range(nombre):
-                echeances.append(f"Echéance {i+1}: {montant_echeance:.2f} EUR")
+            montants = [prix_total_euros / nombre] * nombre
     elif methode_calcul == 'montant':
         montant = float(request.form.get('montant_echeance', prix_total_euros))
         if montant > 0:
             nombre_echeances = math.ceil(prix_total_euros / montant)
-            for i in range(nombre_echeances):
-                montant_a_afficher = montant if (i < nombre_echeances - 1) else prix_total_euros - (montant * (nombre_echeances - 1))
-                echeances.append(f"Echéance {i+1}: {montant_a_afficher:.2f} EUR")
+            # Échéances pleines, puis le solde en dernière position
+            montants = [montant] * (nombre_echeances - 1)
+            montants.append(prix_total_euros - (montant * (nombre_echeances - 1)))
 
-    # Récupérer la configuration pour le logo/signatures
-    config_row = db.execute("SELECT * FROM config_etablissement WHERE id = 1").fetchone()
-    config = dict(config_row) if config_row else {}
+    echeances = [f"Echéance {i}: {m:.2f} EUR" for i, m in enumerate(montants, 1)]
 
     # Génération du PDF
     pdf = PDF(orientation='P', unit='mm', format='A4')
     pdf.add_page()
-    try:
-        draw_logo_if_present(pdf, config)
-    except Exception:
-        pass
 
     # En-tête de l'établissement
-    pdf.set_font('Helvetica', 'B', 14)
-    pdf.cell(0, 10, encode_str(config.get('nom_etablissement', 'Nom du Collège')), 0, 1, 'L')
-    pdf.set_font('Helvetica', '', 12)
-    pdf.cell(0, 10, 'Service de Gestion', 0, 1, 'L')
-    pdf.ln(15)
+    draw_letterhead(pdf, config)
 
     # Titre
     pdf.set_font('Helvetica', 'B', 16)
@@ -1728,7 +2235,8 @@ def generer_echeancier_pdf(voyage_id):
 
     # Corps de la lettre
     pdf.set_font('Helvetica', '', 12)
-    pdf.multi_cell(content_width(pdf), 7, encode_str(f"Madame, Monsieur,\n\n"
+    cw = content_width(pdf)
+    pdf.multi_cell(cw, 7, encode_str(f"Madame, Monsieur,\n\n"
                          f"Nous avons le plaisir de vous informer de l'organisation d'un voyage scolaire à destination de {voyage['destination']}, "
                          f"qui se déroulera à partir du {voyage['date_depart'].strftime('%d/%m/%Y')}.\n\n"
                          f"Le coût total de la participation pour chaque élève a été fixé à {prix_total_euros:.2f} EUR."))
@@ -1742,7 +2250,7 @@ def generer_echeancier_pdf(voyage_id):
             pdf.cell(0, 7, f"- {echeance}", 0, 1)
         pdf.ln(5)
         pdf.set_font('Helvetica', 'I', 10)
-        pdf.multi_cell(content_width(pdf), 5, encode_str("Veuillez noter que les dates limites pour chaque paiement vous seront communiquées ultérieurement. "
+        pdf.multi_cell(cw, 5, encode_str("Veuillez noter que les dates limites pour chaque paiement vous seront communiquées ultérieurement. "
                               "N'hésitez pas à contacter le service de gestion pour toute question."))
 
     pdf.ln(20)
@@ -1751,38 +2259,34 @@ def generer_echeancier_pdf(voyage_id):
     pdf.cell(0, 10, "L'équipe de gestion.", 0, 1)
 
     pdf.ln(10)
-    pdf.set_font('Helvetica', '', 12)
-    pdf.cell(0, 7, encode_str(f"Fait à {config.get('ville_signature', 'Ville')}, le {date.today().strftime('%d/%m/%Y')}"), 0, 1, 'R')
-    pdf.ln(10)
-    draw_signature_pair(pdf, config, 'ordonnateur_image', config.get('ordonnateur_nom', 'Le Principal,'),
-                'secretaire_image', config.get('secretaire_general_nom', 'Le Secrétaire Général,'), img_mm=22.6)
+    draw_signoff(pdf, config, font_size=12, space_after=10)
 
-    _buf = pdf.output(dest='S')
-    if isinstance(_buf, (bytes, bytearray)):
-        _data = bytes(_buf)
-    else:
-        _data = _buf.encode('latin-1')
-    response = make_response(_data)
-    response.headers.set('Content-Disposition', 'attachment', filename=f"echeancier_{sanitize_filename(voyage['destination'])}.pdf")
-    response.headers.set('Content-Type', 'application/pdf')
-    return response
+    return pdf_response(pdf, f"echeancier_{sanitize_filename(voyage['destination'])}.pdf")
 
 # -------------------------------------------
 #  Gestion du budget
 # -------------------------------------------
 
+def partager_budget(items):
+    """Sépare les lignes budgétaires en dépenses et recettes et totalise chaque groupe (en centimes),
+    en un seul passage sur les lignes."""
+    groupes = {'depense': [], 'recette': []}
+    totaux = {'depense': 0, 'recette': 0}
+    for item in items:
+        type_ = item['type']
+        groupes[type_].append(item)
+        totaux[type_] += item['montant']
+    return groupes['depense'], groupes['recette'], totaux['depense'], totaux['recette']
+
 @app.route('/voyage/<int:voyage_id>/budget')
+@cached_page
 def voyage_budget(voyage_id):
     """Affiche la page de gestion du budget pour un voyage."""
     voyage = get_voyage(voyage_id)
     db = get_db()
 
-    categories = db.execute('SELECT * FROM budget_categories ORDER BY nom').fetchall()
+    categories = get_reference_rows(SQL_BUDGET_CATEGORIES)
     
-    # Récupérer la configuration pour le logo/signatures
-    config_row = db.execute("SELECT * FROM config_etablissement WHERE id = 1").fetchone()
-    config = dict(config_row) if config_row else {}
-
     items = db.execute(
         """
         SELECT bi.*, bc.nom as categorie_nom FROM budget_items bi
@@ -1791,32 +2295,13 @@ def voyage_budget(voyage_id):
         """, (voyage_id,)
     ).fetchall()
 
-    depenses = [item for item in items if item['type'] == 'depense']
-    recettes = [item for item in items if item['type'] == 'recette']
-
-    total_depenses_cents = sum(item['montant'] for item in depenses)
-    total_recettes_cents = sum(item['montant'] for item in recettes)
+    depenses, recettes, total_depenses_cents, total_recettes_cents = partager_budget(items)
     solde_cents = total_recettes_cents - total_depenses_cents
 
-    # Calculs pour l'entête récap
-    participants_raw = db.execute(
-        """
-        SELECT p.*, c.montant_initial, c.montant_remise, c.id as creance_id
-        FROM participants p
-        JOIN creances c ON p.id = c.participant_id
-        WHERE p.voyage_id = ?
-        ORDER BY p.nom, p.prenom
-        """, (voyage_id,)
-    ).fetchall()
-    nb_inscrits = len([p for p in participants_raw if p['statut'] == 'INSCRIT'])
-    total_percu_voyage_cents = 0
-    for participant in participants_raw:
-        paiements = db.execute(
-            'SELECT SUM(montant) as total FROM paiements WHERE creance_id = ?', (participant['creance_id'],)
-        ).fetchone()
-        total_paye_cents = paiements['total'] or 0
-        if participant['statut'] == 'INSCRIT':
-            total_percu_voyage_cents += total_paye_cents
+    # Calculs pour l'entête récap : comptage et total perçu agrégés en SQL (comme fonds_sociaux)
+    recap = db.execute(SQL_RECAP_INSCRITS, (voyage_id,)).fetchone()
+    nb_inscrits = recap['nb_inscrits']
+    total_percu_voyage_cents = recap['total_percu']
     montant_total_attendu_cents = voyage['nb_participants_attendu'] * voyage['prix_eleve']
     return render_template('voyage_budget.html', voyage=voyage, categories=categories,
                            depenses=depenses, recettes=recettes, total_depenses=total_depenses_cents,
@@ -1837,13 +2322,18 @@ def ajouter_item_budget():
     if not all([voyage_id, type, categorie_id, description, montant]):
         return redirect(url_for('voyage_budget', voyage_id=voyage_id))
 
+    try:
+        montant_cents = euros_str_to_cents(montant)
+    except ValueError:
+        return redirect(url_for('voyage_budget', voyage_id=voyage_id))
+
     db = get_db()
     db.execute(
         'INSERT INTO budget_items (voyage_id, type, categorie_id, description, montant) VALUES (?, ?, ?, ?, ?)',
-        (voyage_id, type, categorie_id, description, int(float(montant) * 100))
+        (voyage_id, type, categorie_id, description, montant_cents)
     )
     db.commit()
-    return redirect(url_for('voyage_budget', voyage_id=voyage_id))
+    return write_ok(redirect(url_for('voyage_budget', voyage_id=voyage_id)))
 
 @app.route('/budget/supprimer/<int:item_id>', methods=['POST'])
 def supprimer_item_budget(item_id):
@@ -1854,7 +2344,7 @@ def supprimer_item_budget(item_id):
         voyage_id = item['voyage_id']
         db.execute('DELETE FROM budget_items WHERE id = ?', (item_id,))
         db.commit()
-        return redirect(url_for('voyage_budget', voyage_id=voyage_id))
+        return write_ok(redirect(url_for('voyage_budget', voyage_id=voyage_id)))
     return redirect(url_for('index'))
 
 @app.route('/voyage/<int:voyage_id>/budget_pdf')
@@ -1863,8 +2353,7 @@ def generer_budget_pdf(voyage_id):
     voyage = get_voyage(voyage_id)
     db = get_db()
     # charger la configuration (logo/signatures)
-    config_row = db.execute("SELECT * FROM config_etablissement WHERE id = 1").fetchone()
-    config = dict(config_row) if config_row else {}
+    config = get_config()
 
     items = db.execute(
         """
@@ -1874,16 +2363,15 @@ def generer_budget_pdf(voyage_id):
         """, (voyage_id,)
     ).fetchall()
 
-    depenses_raw = [item for item in items if item['type'] == 'depense']
-    recettes_raw = [item for item in items if item['type'] == 'recette']
-    
-    total_depenses_cents = sum(item['montant'] for item in depenses_raw)
-    total_recettes_cents = sum(item['montant'] for item in recettes_raw)
+    depenses_raw, recettes_raw, total_depenses_cents, total_recettes_cents = partager_budget(items)
     solde_cents = total_recettes_cents - total_depenses_cents
 
-    # Conversion en euros pour affichage
-    depenses = [{**d, 'montant': d['montant'] / 100.0} for d in depenses_raw]
-    recettes = [{**r, 'montant': r['montant'] / 100.0} for r in recettes_raw]
+    # Lignes des tableaux préparées avant le dessin : libellé encodé et montant (en euros) formaté
+    def lignes(items):
+        return [(encode_str(f"{item['categorie_nom']} - {item['description']}"), f"{item['montant'] / 100.0:.2f} EUR")
+                for item in items]
+    depenses = lignes(depenses_raw)
+    recettes = lignes(recettes_raw)
     total_depenses = total_depenses_cents / 100.0
     total_recettes = total_recettes_cents / 100.0
     solde = solde_cents / 100.0
@@ -1927,9 +2415,10 @@ def generer_budget_pdf(voyage_id):
         pdf.cell(130, 7, 'Description', 1)
         pdf.cell(60, 7, 'Montant', 1, 1, 'C')
         pdf.set_font('Helvetica', '', 10)
-        for item in data:
-            pdf.cell(130, 7, encode_str(f"{item['categorie_nom']} - {item['description']}"), 1)
-            pdf.cell(60, 7, f"{item['montant']:.2f} EUR", 1, 1, 'R')
+        cell = pdf.cell
+        for libelle, montant in data:
+            cell(130, 7, libelle, 1)
+            cell(60, 7, montant, 1, 1, 'R')
 
     draw_table(f"Recettes ({total_recettes:.2f} EUR)", recettes, (223, 240, 216)) # Vert clair
     pdf.ln(5)
@@ -1944,27 +2433,22 @@ def generer_budget_pdf(voyage_id):
     pdf.set_font('Helvetica', 'B', 12)
     pdf.cell(0, 10, "Indicateurs Clés", 0, 1)
     pdf.set_font('Helvetica', '', 10)
-    pdf.multi_cell(content_width(pdf), 7, f"- Coût total par élève : {prix_par_eleve:.2f} EUR\n"
-                         f"- Coût total par accompagnateur : {prix_par_accompagnateur:.2f} EUR\n"
-                         f"- Coût moyen par participant (tous inclus) : {prix_moyen_participant:.2f} EUR\n"
-                         f"- Coût moyen par nuit et par participant : {prix_moyen_nuite:.2f} EUR")
+    # Quatre lignes courtes, sans retour à la ligne automatique : une cellule chacune,
+    # plutôt que le découpage en mots de multi_cell
+    indicateurs = (
+        ("Coût total par élève", prix_par_eleve),
+        ("Coût total par accompagnateur", prix_par_accompagnateur),
+        ("Coût moyen par participant (tous inclus)", prix_moyen_participant),
+        ("Coût moyen par nuit et par participant", prix_moyen_nuite),
+    )
+    cw = content_width(pdf)
+    for libelle, montant in indicateurs:
+        pdf.cell(cw, 7, f"- {libelle} : {montant:.2f} EUR", 0, 1)
 
     pdf.ln(8)
-    pdf.set_font('Helvetica', '', 12)
-    pdf.cell(0, 7, encode_str(f"Fait à {config.get('ville_signature', 'Ville')}, le {date.today().strftime('%d/%m/%Y')}"), 0, 1, 'R')
-    pdf.ln(8)
-    draw_signature_pair(pdf, config, 'ordonnateur_image', config.get('ordonnateur_nom', 'Le Principal,'),
-                'secretaire_image', config.get('secretaire_general_nom', 'Le Secrétaire Général,'), img_mm=22.6)
+    draw_signoff(pdf, config, font_size=12, space_after=8)
 
-    _buf = pdf.output(dest='S')
-    if isinstance(_buf, (bytes, bytearray)):
-        _data = bytes(_buf)
-    else:
-        _data = _buf.encode('latin-1')
-    response = make_response(_data)
-    response.headers.set('Content-Disposition', 'attachment', filename=f"budget_{sanitize_filename(voyage['destination'])}.pdf")
-    response.headers.set('Content-Type', 'application/pdf')
-    return response
+    return pdf_response(pdf, f"budget_{sanitize_filename(voyage['destination'])}.pdf")
 
 # -------------------------------------------
 #  Gestion des paiements
@@ -1972,48 +2456,47 @@ def generer_budget_pdf(voyage_id):
 
 @app.route('/paiement/ajouter', methods=['POST'])
 def ajouter_paiement():
-    """Ajoute un paiement pour un participant."""
+    """Ajoute un ou plusieurs paiements.
+    Le formulaire peut répéter participant_id, mode_paiement_id, montant, date (et reference) :
+    toutes les lignes sont insérées par une seule instruction préparée, dans une seule transaction."""
     voyage_id = request.form['voyage_id']
-    participant_id = request.form['participant_id']
-    mode_paiement_id = request.form['mode_paiement_id']
-    montant = request.form['montant']
-    date_paiement_str = request.form['date']
-    reference = request.form.get('reference', '')
-
-    if not all([voyage_id, participant_id, mode_paiement_id, montant, date_paiement_str]):
+    participant_ids = request.form.getlist('participant_id')
+    modes = request.form.getlist('mode_paiement_id')
+    montants = request.form.getlist('montant')
+    dates = request.form.getlist('date')
+    references = request.form.getlist('reference')
+
+    if not voyage_id or not participant_ids or not (len(participant_ids) == len(modes) == len(montants) == len(dates)) \
+            or len(references) > len(participant_ids):
         return redirect(url_for('voyage_details', voyage_id=voyage_id))
 
-    date_paiement = datetime.strptime(date_paiement_str, '%Y-%m-%d').date()
+    rows = []
+    for participant_id, mode_paiement_id, montant, date_paiement_str, reference in zip_longest(
+            participant_ids, modes, montants, dates, references, fillvalue=''):
+        if not all([participant_id, mode_paiement_id, montant, date_paiement_str]):
+            return redirect(url_for('voyage_details', voyage_id=voyage_id))
+        try:
+            rows.append((mode_paiement_id, euros_str_to_cents(montant), date.fromisoformat(date_paiement_str),
+                         reference, participant_id))
+        except ValueError:
+            return redirect(url_for('voyage_details', voyage_id=voyage_id))
 
     db = get_db()
-    
-    # Récupérer la créance du participant
-    creance = db.execute(
-        'SELECT id FROM creances WHERE participant_id = ?', (participant_id,)
-    ).fetchone()
-    
-    if creance is None:
+    # La créance de chaque participant est retrouvée par l'INSERT ... SELECT lui-même
+    cursor = db.executemany(SQL_INSERT_PAIEMENT_PARTICIPANT, rows)
+    if cursor.rowcount != len(rows):
         # Gérer le cas où aucune créance n'existe, bien que cela ne devrait pas arriver
+        db.rollback()
         return "Erreur : aucune créance trouvée pour ce participant.", 500
-        
-    db.execute(
-        'INSERT INTO paiements (creance_id, mode_paiement_id, montant, date, reference) VALUES (?, ?, ?, ?, ?)',
-        (creance['id'], mode_paiement_id, int(float(montant) * 100), date_paiement, reference)
-    )
     db.commit()
-    return redirect(url_for('voyage_details', voyage_id=voyage_id))
+    return write_ok(redirect(url_for('voyage_details', voyage_id=voyage_id)))
 
 @app.route('/paiement/<int:paiement_id>/modifier', methods=['GET', 'POST'])
 def modifier_paiement(paiement_id):
     """Modifie un paiement existant."""
+    # Paiement et participant (via la créance) en une seule requête
     paiement = get_paiement(paiement_id)
     db = get_db()
-    
-    # Retrouver le participant via la créance
-    creance = db.execute('SELECT participant_id FROM creances WHERE id = ?', (paiement['creance_id'],)).fetchone()
-    if not creance:
-        abort(404, "Créance non trouvée pour ce paiement.")
-    participant = get_participant(creance['participant_id'])
 
     if request.method == 'POST':
         montant = request.form['montant']
@@ -2024,7 +2507,11 @@ def modifier_paiement(paiement_id):
         if not all([montant, mode_paiement_id, date_paiement_str]):
             return redirect(url_for('modifier_paiement', paiement_id=paiement_id))
 
-        date_paiement = datetime.strptime(date_paiement_str, '%Y-%m-%d').date()
+        try:
+            date_paiement = date.fromisoformat(date_paiement_str)
+            montant_cents = euros_str_to_cents(montant)
+        except ValueError:
+            return redirect(url_for('modifier_paiement', paiement_id=paiement_id))
 
         db.execute(
             """
@@ -2032,30 +2519,26 @@ def modifier_paiement(paiement_id):
             SET montant = ?, mode_paiement_id = ?, date = ?, reference = ?
             WHERE id = ?
             """,
-            (int(float(montant) * 100), mode_paiement_id, date_paiement, reference, paiement_id)
+            (montant_cents, mode_paiement_id, date_paiement, reference, paiement_id)
         )
         db.commit()
-        return redirect(url_for('participant_paiements', participant_id=participant['id']))
+        return write_ok(redirect(url_for('participant_paiements', participant_id=paiement['participant_id'])))
 
-    modes_paiement = db.execute('SELECT * FROM modes_paiement ORDER BY libelle').fetchall()
-    return render_template('modifier_paiement.html', paiement=paiement, participant=participant, modes_paiement=modes_paiement)
+    modes_paiement = get_reference_rows(SQL_MODES_PAIEMENT)
+    return render_template('modifier_paiement.html', paiement=paiement, modes_paiement=modes_paiement)
 
 @app.route('/paiement/<int:paiement_id>/supprimer', methods=['POST'])
 def supprimer_paiement(paiement_id):
     """Supprime un paiement."""
+    # le participant (pour la redirection) est lu avec le paiement
     paiement = get_paiement(paiement_id)
+    participant_id = paiement['participant_id']
     db = get_db()
-    
-    creance = db.execute('SELECT participant_id FROM creances WHERE id = ?', (paiement['creance_id'],)).fetchone()
-    if not creance:
-        return redirect(url_for('index')) # Redirection de sécurité
-    
-    participant_id = creance['participant_id']
-    
+
     db.execute('DELETE FROM paiements WHERE id = ?', (paiement_id,))
     db.commit()
     
-    return redirect(url_for('participant_paiements', participant_id=participant_id))
+    return write_ok(redirect(url_for('participant_paiements', participant_id=participant_id)))
 
 
 
@@ -2066,15 +2549,21 @@ def supprimer_paiement(paiement_id):
 
 @app.route('/configuration')
 def configuration():
-    """Affiche la page de configuration."""
-    db = get_db()
-    modes = db.execute('SELECT * FROM modes_paiement ORDER BY libelle').fetchall()
-    categories = db.execute('SELECT * FROM budget_categories ORDER BY nom').fetchall()
-    config = db.execute("SELECT * FROM config_etablissement WHERE id = 1").fetchone()
+    """Affiche la page de configuration.
+    Les trois lectures passent par des caches de processus : aucune requête SQL une fois ceux-ci remplis."""
+    modes = get_reference_rows(SQL_MODES_PAIEMENT)
+    categories = get_reference_rows(SQL_BUDGET_CATEGORIES)
+    config = get_config()
 
     return render_template('configuration.html', modes=modes, categories=categories, config=config)
 
 
+@functools.lru_cache(maxsize=16)
+def config_update_sql(fields):
+    """UPDATE de config_etablissement pour ces colonnes ; une chaîne par combinaison (8 au plus),
+    toujours identique, donc retrouvée dans le cache d'instructions préparées de la connexion."""
+    return f"UPDATE config_etablissement SET {', '.join([f'{field} = ?' for field in fields])} WHERE id = 1"
+
 @app.route('/configuration/enregistrer', methods=['POST'])
 def enregistrer_config():
     """Enregistre la configuration de l'établissement (texte + images si fournies)."""
@@ -2083,30 +2572,30 @@ def enregistrer_config():
         'nom_etablissement', 'adresse', 'ordonnateur_nom',
         'secretaire_general_nom', 'ville_signature', 'texte_attestation'
     ]
-
-    query = f"UPDATE config_etablissement SET {', '.join([f'{field} = ?' for field in fields])} WHERE id = 1"
     values = [request.form.get(field) for field in fields]
-    db.execute(query, values)
-
-    # Handle file uploads (logo and signature images)
-    logo_file = request.files.get('logo')
-    ord_file = request.files.get('ordonnateur_image')
-    sec_file = request.files.get('secretaire_image')
-
-    if logo_file and logo_file.filename:
-        saved = save_uploaded_file(logo_file, subfolder='config', prefix='logo')
-        if saved:
-            db.execute('UPDATE config_etablissement SET logo_path = ? WHERE id = 1', (saved,))
-    if ord_file and ord_file.filename:
-        saved = save_uploaded_file(ord_file, subfolder='config', prefix='ordonnateur')
-        if saved:
-            db.execute('UPDATE config_etablissement SET ordonnateur_image = ? WHERE id = 1', (saved,))
-    if sec_file and sec_file.filename:
-        saved = save_uploaded_file(sec_file, subfolder='config', prefix='secretaire')
-        if saved:
-            db.execute('UPDATE config_etablissement SET secretaire_image = ? WHERE id = 1', (saved,))
+
+    # Images (logo et signatures) : enregistrées sur disque d'abord, puis leurs colonnes
+    # ajoutées au même UPDATE que les champs texte (une seule écriture en base)
+    saved_images = []
+    for form_key, column, prefix in (('logo', 'logo_path', 'logo'),
+                                     ('ordonnateur_image', 'ordonnateur_image', 'ordonnateur'),
+                                     ('secretaire_image', 'secretaire_image', 'secretaire')):
+        uploaded = request.files.get(form_key)
+        if uploaded and uploaded.filename:
+            saved = save_uploaded_file(uploaded, subfolder='config', prefix=prefix)
+            if saved:
+                fields.append(column)
+                values.append(saved)
+                saved_images.append(saved)
+
+    db.execute(config_update_sql(tuple(fields)), values)
     db.commit()
-    return redirect(url_for('configuration'))
+    # préparer dès maintenant les images pour les PDF (décodage hors du chemin de génération)
+    for rel in saved_images:
+        warm_pdf_image(os.path.join(app.config['UPLOAD_FOLDER'], rel))
+    # la configuration a changé : invalider le cache
+    invalidate_config_cache()
+    return write_ok(redirect(url_for('configuration')))
 # Backup feature removed by user request: no backup routes available.
 
 @app.route('/configuration/ajouter_mode_paiement', methods=['POST'])
@@ -2115,25 +2604,38 @@ def ajouter_mode_paiement():
     libelle = request.form['libelle']
     if libelle:
         db = get_db()
-        try:
-            db.execute('INSERT INTO modes_paiement (libelle) VALUES (?)', (libelle,))
-            db.commit()
-        except sqlite3.IntegrityError:
-            pass
+        # libellé déjà présent : INSERT OR IGNORE n'insère rien (pas d'exception à rattraper)
+        inserted = db.execute(SQL_SEED_MODE_PAIEMENT, (libelle,)).rowcount
+        db.commit()
+        if inserted:
+            invalidate_reference_cache()
+        return write_ok(redirect(url_for('configuration')))
     return redirect(url_for('configuration'))
 
+def is_referenced(sql, value):
+    """Vrai si la requête de contrôle (SQL_MODE_PAIEMENT_UTILISE, SQL_CATEGORIE_UTILISEE) trouve une ligne."""
+    return get_db().execute(sql, (value,)).fetchone() is not None
+
 @app.route('/configuration/supprimer_mode_paiement/<int:mode_id>', methods=['POST'])
 def supprimer_mode_paiement(mode_id):
     """Supprime un mode de paiement."""
+    # Mode utilisé par des paiements : suppression refusée avant toute écriture
+    if is_referenced(SQL_MODE_PAIEMENT_UTILISE, mode_id):
+        flash('Mode de paiement utilisé, suppression refusée.', 'warning')
+        return redirect(url_for('configuration'))
     db = get_db()
     try:
         db.execute('DELETE FROM modes_paiement WHERE id = ?', (mode_id,))
         db.commit()
+        # l'id mis en cache d'un mode système peut ne plus exister
+        _mode_ids.clear()
+        invalidate_reference_cache()
     except sqlite3.IntegrityError:
-        # Empêche le crash si le mode est utilisé.
-        # Idéalement, on afficherait un message d'erreur à l'utilisateur.
-        print(f"Tentative de suppression du mode de paiement {mode_id} qui est en cours d'utilisation.")
-    return redirect(url_for('configuration'))
+        # paiement ajouté entre le contrôle et la suppression : la clé étrangère refuse toujours
+        db.rollback()
+        flash('Mode de paiement utilisé, suppression refusée.', 'warning')
+        return redirect(url_for('configuration'))
+    return write_ok(redirect(url_for('configuration')))
 
 @app.route('/configuration/budget/categorie/ajouter', methods=['POST'])
 def ajouter_categorie_budget():
@@ -2141,23 +2643,31 @@ def ajouter_categorie_budget():
     nom = request.form['nom']
     if nom:
         db = get_db()
-        try:
-            db.execute('INSERT INTO budget_categories (nom) VALUES (?)', (nom,))
-            db.commit()
-        except sqlite3.IntegrityError:
-            pass
+        # nom déjà présent : INSERT OR IGNORE n'insère rien (pas d'exception à rattraper)
+        inserted = db.execute('INSERT OR IGNORE INTO budget_categories (nom) VALUES (?)', (nom,)).rowcount
+        db.commit()
+        if inserted:
+            invalidate_reference_cache()
+        return write_ok(redirect(url_for('configuration')))
     return redirect(url_for('configuration'))
 
 @app.route('/configuration/budget/categorie/supprimer/<int:categorie_id>', methods=['POST'])
 def supprimer_categorie_budget(categorie_id):
     """Supprime une catégorie de budget."""
+    # Catégorie utilisée par des lignes budgétaires : suppression refusée avant toute écriture
+    if is_referenced(SQL_CATEGORIE_UTILISEE, categorie_id):
+        flash('Catégorie utilisée, suppression refusée.', 'warning')
+        return redirect(url_for('configuration'))
     db = get_db()
     try:
         db.execute('DELETE FROM budget_categories WHERE id = ?', (categorie_id,))
         db.commit()
+        invalidate_reference_cache()
     except sqlite3.IntegrityError:
-        print(f"Tentative de suppression de la catégorie {categorie_id} qui est en cours d'utilisation.")
-    return redirect(url_for('configuration'))
+        db.rollback()
+        flash('Catégorie utilisée, suppression refusée.', 'warning')
+        return redirect(url_for('configuration'))
+    return write_ok(redirect(url_for('configuration')))
 
 # -------------------------------------------
 #  Fonctions Administrateur (Danger Zone)
@@ -2165,22 +2675,27 @@ def supprimer_categorie_budget(categorie_id):
 
 @app.route('/admin/reset_db', methods=['POST'])
 def reset_db_route():
-    """Supprime et réinitialise la base de données."""
-    close_db(None)
-    db_path = app.config['DATABASE']
-    if os.path.exists(db_path):
-        os.remove(db_path)
-    init_db()
-    return redirect(url_for('configuration'))
+    """Vide et réinitialise la base de données.
+    Le fichier est conservé : le contenu d'une base vierge (pristine_db) y est recopié en une seule
+    opération atomique, sans fermer les connexions du pool ni laisser de fichiers -wal/-shm orphelins."""
+    pristine_db().backup(get_db())
+    _mode_ids.clear()
+    invalidate_config_cache()
+    invalidate_reference_cache()
+    # la copie par backup() n'apparaît pas dans total_changes
+    invalidate_page_cache()
+    return write_ok(redirect(url_for('configuration')))
 
 @app.route('/admin/demo_data', methods=['POST'])
 def demo_data_route():
     """Injecte un jeu de données de démonstration complet et réaliste."""
     db = get_db()
     try:
+        # Toute l'injection dans une seule transaction, verrou d'écriture pris d'emblée
+        db.execute('BEGIN IMMEDIATE')
         # === VOYAGE 1: BERLIN (30 participants) ===
         cursor = db.execute(
-            "INSERT INTO voyages (destination, date_depart, prix_eleve, nb_participants_attendu) VALUES (?, ?, ?, ?)",
+            SQL_INSERT_VOYAGE_SIMPLE,
             ('Berlin, Allemagne', date(2026, 6, 10), 62000, 30)
         )
         v1_id = cursor.lastrowid
@@ -2190,54 +2705,60 @@ def demo_data_route():
         prenoms = ['Jean', 'Pierre', 'Marie', 'Lucas', 'Alice', 'Hugo', 'Chloé', 'Louis', 'Léa', 'Gabriel']
         classes = ['3A', '3B', '3C']
 
-        for i in range(30):
-            nom = random.choice(noms)
-            prenom = random.choice(prenoms)
-            p_cursor = db.execute("INSERT INTO participants (voyage_id, type, nom, prenom, classe, statut) VALUES (?, ?, ?, ?, ?, ?)", 
-                                  (v1_id, 'ELEVE', f'{nom}{i}', f'{prenom}{i}', random.choice(classes), 'INSCRIT'))
-            p_id = p_cursor.lastrowid
-            
-            db.execute("INSERT INTO creances (participant_id, montant_initial) VALUES (?, ?)", (p_id, prix_v1))
-            creance_id = db.execute('SELECT id FROM creances WHERE participant_id = ?', (p_id,)).fetchone()['id']
+        # Tirages groupés d'abord (noms, classes, scénario et montant de chacun), écritures en bloc ensuite
+        n = 30
+        tirages = zip(random.choices(noms, k=n), random.choices(prenoms, k=n), random.choices(classes, k=n),
+                      random.choices(range(1, 11), k=n), [random.randint(10000, 40000) for _ in range(n)])
+        participants = []
+        scenarios = []
+        for i, (nom, prenom, classe, cas, montant_paye) in enumerate(tirages):
+            participants.append((v1_id, 'ELEVE', f'{nom}{i}', f'{prenom}{i}', classe, 'INSCRIT'))
 
             # Simuler des paiements et des statuts
-            cas = random.randint(1, 10)
             if cas <= 5: # Paiement partiel
-                montant_paye = random.randint(10000, 40000)
-                db.execute("INSERT INTO paiements (creance_id, mode_paiement_id, montant, date) VALUES (?, ?, ?, ?)", 
-                           (creance_id, 1, montant_paye, date.today()))
+                scenarios.append((montant_paye, False))
             elif cas <= 8: # Paiement complet
-                db.execute("INSERT INTO paiements (creance_id, mode_paiement_id, montant, date) VALUES (?, ?, ?, ?)", 
-                           (creance_id, 1, prix_v1, date.today()))
+                scenarios.append((prix_v1, False))
             elif cas == 9: # Annulation avec remboursement
-                montant_paye = random.randint(10000, 40000)
-                db.execute("INSERT INTO paiements (creance_id, mode_paiement_id, montant, date) VALUES (?, ?, ?, ?)", 
-                           (creance_id, 1, montant_paye, date.today()))
-                db.execute("UPDATE participants SET statut = ? WHERE id = ?", ('A_REMBOURSER', p_id))
-            # Cas 10 = Pas de paiement
+                scenarios.append((montant_paye, True))
+            else: # Cas 10 = Pas de paiement
+                scenarios.append((None, False))
+
+        insert_demo_participants(db, v1_id, participants, prix_v1)
+        # (participant, créance) dans l'ordre d'insertion, donc dans l'ordre des scénarios
+        ids = db.execute(SQL_CREANCES_PAR_VOYAGE, (v1_id,)).fetchall()
+
+        paiements = []
+        a_rembourser = []
+        aujourd_hui = date.today()
+        for (p_id, creance_id), (montant_paye, rembourse) in zip(ids, scenarios):
+            if montant_paye is not None:
+                paiements.append((creance_id, 1, montant_paye, aujourd_hui, None))
+            if rembourse:
+                a_rembourser.append(('A_REMBOURSER', p_id))
+
+        bulk_insert_paiements(db, paiements)
+        db.executemany(SQL_UPDATE_STATUT_PARTICIPANT, a_rembourser)
 
         # === VOYAGE 2: LONDRES (petit groupe) ===
         cursor = db.execute(
-            "INSERT INTO voyages (destination, date_depart, prix_eleve, nb_participants_attendu) VALUES (?, ?, ?, ?)",
+            SQL_INSERT_VOYAGE_SIMPLE,
             ('Londres, Royaume-Uni', date(2026, 7, 5), 45000, 15)
         )
         v2_id = cursor.lastrowid
         prix_v2 = 45000
         
-        for i in range(5):
-            nom = random.choice(noms)
-            prenom = random.choice(prenoms)
-            p_cursor = db.execute("INSERT INTO participants (voyage_id, type, nom, prenom, classe, statut) VALUES (?, ?, ?, ?, ?, ?)", 
-                                  (v2_id, 'ELEVE', f'{nom}_v2_{i}', f'{prenom}_v2_{i}', '4A', 'INSCRIT'))
-            p_id = p_cursor.lastrowid
-            db.execute("INSERT INTO creances (participant_id, montant_initial) VALUES (?, ?)", (p_id, prix_v2))
+        participants = [(v2_id, 'ELEVE', f'{nom}_v2_{i}', f'{prenom}_v2_{i}', '4A', 'INSCRIT')
+                        for i, (nom, prenom) in enumerate(zip(random.choices(noms, k=5), random.choices(prenoms, k=5)))]
+        insert_demo_participants(db, v2_id, participants, prix_v2)
 
         db.commit()
     except Exception as e:
         db.rollback()
         print(f"Erreur lors de l'injection des données de démo : {e}")
-    
-    return redirect(url_for('index'))
+        return redirect(url_for('index'))
+
+    return write_ok(redirect(url_for('index')))
 
 
 @app.route('/admin/create_test_rembourse', methods=['POST'])
@@ -2246,31 +2767,24 @@ def create_test_rembourse():
     db = get_db()
     # Créer un voyage de test
     cursor = db.execute(
-        "INSERT INTO voyages (destination, date_depart, prix_eleve, nb_participants_attendu) VALUES (?, ?, ?, ?)",
+        SQL_INSERT_VOYAGE_SIMPLE,
         ('Test Remboursement', date.today(), 5000, 10)
     )
     voyage_id = cursor.lastrowid
 
     # Créer un participant
-    cur = db.execute("INSERT INTO participants (voyage_id, type, nom, prenom, classe, statut) VALUES (?, ?, ?, ?, ?, ?)",
-                    (voyage_id, 'ELEVE', 'Test', 'Remb', 'T1', 'A_REMBOURSER'))
+    cur = db.execute(SQL_INSERT_PARTICIPANT,
+                     (voyage_id, 'ELEVE', 'Test', 'Remb', 'T1', 'A_REMBOURSER'))
     participant_id = cur.lastrowid
 
     # Créer une créance et un paiement (simulateur : la famille a payé 50,00 EUR)
-    db.execute("INSERT INTO creances (participant_id, montant_initial) VALUES (?, ?)", (participant_id, 5000))
-    creance_id = db.execute('SELECT id FROM creances WHERE participant_id = ?', (participant_id,)).fetchone()['id']
+    creance_id = db.execute(SQL_INSERT_CREANCE, (participant_id, 5000)).lastrowid
     # Simuler un paiement de 50 EUR
-    mode = db.execute('SELECT id FROM modes_paiement WHERE libelle = ?', ('Espèces',)).fetchone()
-    if not mode:
-        curm = db.execute("INSERT INTO modes_paiement (libelle) VALUES ('Espèces')")
-        mode_id = curm.lastrowid
-    else:
-        mode_id = mode['id']
-    db.execute('INSERT INTO paiements (creance_id, mode_paiement_id, montant, date, reference) VALUES (?, ?, ?, ?, ?)',
-               (creance_id, mode_id, 5000, date.today(), 'Paiement test'))
+    mode_id = get_mode_paiement_id('Espèces')
+    db.execute(SQL_INSERT_PAIEMENT, (creance_id, mode_id, 5000, date.today(), 'Paiement test'))
 
     db.commit()
-    return redirect(url_for('voyage_details', voyage_id=voyage_id))
+    return write_ok(redirect(url_for('voyage_details', voyage_id=voyage_id)))
 
 # -------------------------------------------
 #  Initialisation et lancement de l'application
@@ -2300,48 +2814,48 @@ if __name__ == '__main__':
         # Utiliser un objet pour stocker l'état partagé entre threads
         class ServerState:
             server = None
-            ready = False
             error = None
 
         state = ServerState()
+        # signalé dès que le socket d'écoute est ouvert (ou en cas d'échec du démarrage)
+        state.ready = Event()
 
         def run_server():
             try:
                 logger.info('[server] Creating Flask server on 127.0.0.1:5001')
                 state.server = make_server('127.0.0.1', 5001, app, threaded=True)
                 logger.info('[server] Server created, marking as ready')
-                state.ready = True
+                state.ready.set()
                 logger.info('[server] Flask server starting serve_forever()')
                 state.server.serve_forever()
                 logger.info('[server] serve_forever() ended')
             except Exception as e:
                 logger.exception('[server] Exception while running Flask server:')
                 state.error = str(e)
-                state.ready = True  # Débloquer l'attente même en cas d'erreur
+                state.ready.set()  # Débloquer l'attente même en cas d'erreur
 
         # NE PAS utiliser daemon=True pour éviter que le thread soit tué prématurément
         t = Thread(target=run_server)
         t.start()
 
         # Attendre que le serveur soit prêt
-        def wait_for_server(host='127.0.0.1', port=5001, timeout=15.0, interval=0.2):
+        def wait_for_server(host='127.0.0.1', port=5001, timeout=15.0):
             logger.info(f'[startup] Waiting for server on {host}:{port}...')
-            deadline = time.time() + timeout
-            while time.time() < deadline:
-                if state.ready:
-                    # Attendre un peu plus que le serveur soit vraiment prêt
-                    time.sleep(0.5)
-                    # Double-check avec une connexion TCP
-                    for _ in range(3):
-                        try:
-                            with socket.create_connection((host, port), timeout=2):
-                                logger.info('[startup] TCP connection successful')
-                                return True
-                        except Exception as e:
-                            logger.warning(f'[startup] TCP connect failed: {e}')
-                            time.sleep(0.3)
-                time.sleep(interval)
-            logger.error('[startup] Timeout waiting for server')
+            if not state.ready.wait(timeout):
+                logger.error('[startup] Timeout waiting for server')
+                return False
+            if state.error:
+                return False
+            # make_server a déjà ouvert le socket d'écoute : la connexion est acceptée
+            # (mise en file par le noyau) même si serve_forever() n'a pas encore démarré
+            for _ in range(3):
+                try:
+                    with socket.create_connection((host, port), timeout=2):
+                        logger.info('[startup] TCP connection successful')
+                        return True
+                except Exception as e:
+                    logger.warning(f'[startup] TCP connect failed: {e}')
+                    time.sleep(0.1)
             return False
 
         logger.info('[startup] Waiting for Flask server to be ready...')
@@ -2377,6 +2891,16 @@ if __name__ == '__main__':
             state.server.shutdown()
         t.join(timeout=2)
     else:
-        # Lance le navigateur 1 seconde après le démarrage du serveur
-        Timer(1, open_browser).start()
-        app.run(host='127.0.0.1', port=5001, debug=False)
\ No newline at end of file
+        from werkzeug.serving import make_server
+
+        # make_server ouvre le socket d'écoute tout de suite : le navigateur est lancé sans
+        # délai, sa première connexion attend dans la file du noyau jusqu'à serve_forever().
+        # Un thread par requête (comme ci-dessus) : la génération d'un PDF ne bloque pas les autres pages.
+        server = make_server('127.0.0.1', 5001, app, threaded=True)
+        Thread(target=open_browser, daemon=True).start()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
\ No newline at end of file
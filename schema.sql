@@ -128,13 +128,28 @@ CREATE TABLE IF NOT EXISTS demandes_fonds_sociaux (
     FOREIGN KEY (participant_id) REFERENCES participants (id) ON DELETE CASCADE
 );
 
+-- Index sur les clés de jointure / filtres des requêtes fréquentes
+-- (repris par ensure_config_columns pour les bases existantes)
+-- (creance_id, montant) : index couvrant pour les SUM(montant) par créance
+CREATE INDEX IF NOT EXISTS idx_paiements_creance_montant ON paiements (creance_id, montant);
+CREATE INDEX IF NOT EXISTS idx_participants_voyage_statut ON participants (voyage_id, statut);
+CREATE INDEX IF NOT EXISTS idx_creances_participant ON creances (participant_id);
+CREATE INDEX IF NOT EXISTS idx_demandes_fs_participant ON demandes_fonds_sociaux (participant_id);
+CREATE INDEX IF NOT EXISTS idx_documents_voyage ON documents (voyage_id);
+CREATE INDEX IF NOT EXISTS idx_budget_items_voyage_type ON budget_items (voyage_id, type);
+-- clés étrangères vers modes_paiement / budget_categories (contrôle des suppressions)
+CREATE INDEX IF NOT EXISTS idx_paiements_mode ON paiements (mode_paiement_id);
+CREATE INDEX IF NOT EXISTS idx_budget_items_categorie ON budget_items (categorie_id);
+
 
 -- Insertion des modes de paiement par défaut
 INSERT OR IGNORE INTO modes_paiement (libelle) VALUES
 ('Chèque'),
 ('Espèces'),
 ('Virement'),
-('Carte Bancaire');
+('Carte Bancaire'),
+('Remboursement'),
+('Fonds Social');
 
 -- Insertion des catégories budgétaires par défaut
 INSERT OR IGNORE INTO budget_categories (nom) VALUES